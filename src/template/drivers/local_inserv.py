@@ -7,6 +7,7 @@ code.
 from pathlib import Path
 import logging
 
+from rpyc.core.stream import SocketStream
 from nspyre import InstrumentServer
 from nspyre import InstrumentGateway
 from nspyre import nspyre_init_logger
@@ -14,6 +15,16 @@ from nspyre import serve_instrument_server_cli
 
 _HERE = Path(__file__).parent
 
+# InstrumentGateway doesn't expose socket options, so default rpyc's client sockets to TCP_NODELAY
+# otherwise Nagle's algorithm holds back the small RPC frames that every driver call sends
+_socket_stream_connect = SocketStream.connect.__func__
+
+def _connect_nodelay(cls, host, port, **kwargs):
+    kwargs.setdefault('nodelay', True)
+    return _socket_stream_connect(cls, host, port, **kwargs)
+
+SocketStream.connect = classmethod(_connect_nodelay)
+
 # log to the console as well as a file inside the logs folder
 nspyre_init_logger(
     logging.INFO,
@@ -24,12 +35,19 @@ nspyre_init_logger(
 )
 
 with InstrumentServer() as local_inserv, InstrumentGateway(port=42067) as remote_gw:
-    local_inserv.add('subs', _HERE / 'subsystems_driver.py', 'SubsystemsDriver', args=[local_inserv, remote_gw], local_args=True)
-    local_inserv.add('daq', _HERE / 'nspyre_drivers' / 'ni' / 'daq.py', 'DAQ')
-    local_inserv.add('odmr_driver', _HERE / 'fake_odmr_driver.py', 'FakeODMRInstrument')
-    local_inserv.add('swabian', _HERE / 'nspyre_drivers' / 'swabian' / 'SwabianPS82.py', 'SwabianPulseStreamer82')
-    local_inserv.add('e8527d', _HERE / 'nspyre_drivers' / 'agilent' / 'e8257d.py', 'AgilentE8257D')
-    #local_inserv.add('tlb6725', _HERE / 'nspyre_drivers' / 'newfocus' / 'tlb6725.py', 'TLB6725')
+    # (name, driver file, class, add kwargs)
+    drivers = [
+        ('subs', _HERE / 'subsystems_driver.py', 'SubsystemsDriver', {'args': [local_inserv, remote_gw], 'local_args': True}),
+        ('daq', _HERE / 'nspyre_drivers' / 'ni' / 'daq.py', 'DAQ', {}),
+        ('odmr_driver', _HERE / 'fake_odmr_driver.py', 'FakeODMRInstrument', {}),
+        ('swabian', _HERE / 'nspyre_drivers' / 'swabian' / 'SwabianPS82.py', 'SwabianPulseStreamer82', {}),
+        ('e8527d', _HERE / 'nspyre_drivers' / 'agilent' / 'e8257d.py', 'AgilentE8257D', {}),
+        #('tlb6725', _HERE / 'nspyre_drivers' / 'newfocus' / 'tlb6725.py', 'TLB6725', {}),
+    ]
+    # InstrumentServer.add imports the driver file, constructs the driver and registers it with the server,
+    # the drivers are added one after another in table order
+    for name, path, cls, kwargs in drivers:
+        local_inserv.add(name, path, cls, **kwargs)
     # run a CLI (command-line interface) that allows the user to enter
     # commands to control the server
     serve_instrument_server_cli(local_inserv)
@@ -1,5 +1,6 @@
 
 import string
+import logging
 import numpy as np
 import pyvisa
 from pyvisa import ResourceManager
@@ -8,17 +9,27 @@ from pyvisa import ResourceManager
 
 Some notes: 0 = False, and 1 = True for most of the get functions that refer to on or off
 
-When using these functions in experiments, make sure to call the function as the following:
-Say you wanted to use idn(), you would use it by doing something like this in your experimental file,
+When using these functions in experiments, create one driver instance and reuse it. The VISA session
+is opened once when the driver is constructed and stays open until close() is called:
 
 from [this file path] import AgilentE8257D as AGD
 
-idn(AGD)
-
-I know, weird, but this was the only way to get it to work as of 10/27/2023. 'self' needs to be the class, so 'AGD'
+sg = AGD()
+sg.idn()
+sg.close()
 
 """
 
+_logger = logging.getLogger(__name__)
+
+# shared VISA resource manager, created on first driver use instead of at import
+_rm = None
+
+def _get_rm():
+    global _rm
+    _rm = _rm or pyvisa.ResourceManager()
+    return _rm
+
 class AgilentE8257D:
         
     DEFAULTS = {
@@ -28,19 +39,46 @@ class AgilentE8257D:
         }
     }
     
-    rm = pyvisa.ResourceManager()
     address='192.168.1.45'
 
-    def SG_Connect():
-        rm = pyvisa.ResourceManager()
-        resources = rm.list_resources()
-        print(f"List of connected instruments: {resources}")
-        SG=rm.open_resource(resources[1])
-        print(f"Using the following instrument: {SG.query('*IDN?')}")
+    def __init__(self):
+        # open the VISA session once and keep it for the lifetime of the driver
+        self._rm = _get_rm()
+        self._sg = None
+        self.SG_Connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Close the VISA session."""
+        sg = getattr(self, '_sg', None)
+        if sg is not None:
+            sg.close()
+            self._sg = None
+
+    def SG_Connect(self, discover=False):
+        """(Re)open the VISA session, e.g. after the instrument has been power cycled.
+        The instrument is opened directly by its address; pass discover=True to also
+        list every connected VISA resource (slow, only useful during setup)
+        Call idn() explicitly to check which instrument was opened"""
+        self.close()
+        rm = self._rm
+        if discover:
+            resources = rm.list_resources()
+            _logger.info("List of connected instruments: %s", resources)
+        SG=rm.open_resource(f'TCPIP0::{self.address}::inst0::INSTR', **self.DEFAULTS['COMMON'])
+        self._sg = SG
         return SG
     
     def idn(self):
-        SG = self.SG_Connect()
+        SG = self._sg
         return SG.query('*IDN?')
 
     
@@ -48,13 +86,13 @@ class AgilentE8257D:
         """
         low frequency ampitude (BNC output)
         """
-        SG = self.SG_Connect()
+        SG = self._sg
         LF_amp = float(SG.query('LFO:AMPL?'))
         return LF_amp
     
     
     def set_lf_amplitude(self,value):
-        SG = self.SG_Connect()
+        SG = self._sg
         SG.write('LFO:AMPL {:.2f}'.format(value))
         
     
@@ -63,13 +101,13 @@ class AgilentE8257D:
         RF amplitude (Type N output)
         units are in dBm
         """
-        SG = self.SG_Connect()
+        SG = self._sg
         RF_amp = float(SG.query('POW:AMPL?'))
-        print(f"RF Amplitude [dBm]: {RF_amp}")
+        _logger.debug("RF Amplitude [dBm]: %s", RF_amp)
         return RF_amp
     
     def set_rf_amplitude(self,value):
-        SG = self.SG_Connect()
+        SG = self._sg
         SG.write('POW:AMPL {:.2f}'.format(value))
     
     
@@ -77,12 +115,12 @@ class AgilentE8257D:
         """
         enable or disable low frequency output
         """
-        SG = self.SG_Connect()
+        SG = self._sg
         return float(SG.query('LFO:STAT?'))
 
     
     def set_lf_toggle(self,value):
-        SG = self.SG_Connect()
+        SG = self._sg
         SG.write('LFO:STAT {:s}'.format(value))
     
     
@@ -90,14 +128,14 @@ class AgilentE8257D:
         """
         enable or disable RF output
         """
-        SG = self.SG_Connect()
+        SG = self._sg
         OutputState = SG.query('OUTP:STAT?')
-        print(f"RF output is in the following state: {OutputState}")
+        _logger.debug("RF output is in the following state: %s", OutputState)
         return OutputState
     
     
     def set_rf_toggle(self,value):
-        SG = self.SG_Connect()
+        SG = self._sg
         SG.write('OUTP:STAT {:s}'.format(value))
     
     
@@ -106,27 +144,75 @@ class AgilentE8257D:
         signal frequency
         units are in hertz
         """
-        SG = self.SG_Connect()
+        SG = self._sg
         rf_freq = float(SG.query('FREQ?'))
-        print(f"RF Frequency [GHz] is: {rf_freq*1e-9}")
+        _logger.debug("RF Frequency [GHz] is: %s", rf_freq*1e-9)
         return rf_freq*1e-9
     
     
     def set_rf_frequency(self,value):
-        SG = self.SG_Connect()
+        SG = self._sg
         SG.write('FREQ {:.2f}'.format(value))
     
+
+    def load_freq_list(self, freqs_hz):
+        """
+        loads freqs_hz into the frequency list used by the list sweep (see configure_list_sweep)
+        units are in hertz
+        """
+        SG = self._sg
+        freqs = ','.join(f'{f:.3f}' for f in np.asarray(freqs_hz, dtype=float).ravel())
+        SG.write(f':LIST:FREQ {freqs}')
+
+
+    def configure_list_sweep(self):
+        """
+        switches to list sweep mode, stepping to the next frequency of the loaded list on every
+        external trigger (rear panel TRIG IN). The sweep runs continuously, so it wraps back to
+        the first frequency after the last trigger and is ready to repeat the scan
+        """
+        SG = self._sg
+        SG.write(':LIST:TYPE LIST;:LIST:TRIG:SOUR EXT;:LIST:DWEL:TYPE STEP;:TRIG:SOUR IMM;:INIT:CONT ON;:FREQ:MODE LIST')
+
+
+    def set_rf_frequency_sweep(self, freqs_hz):
+        """
+        loads freqs_hz and switches to list sweep mode (load_freq_list then configure_list_sweep)
+        so an N point scan is two configuration writes instead of N set_rf_frequency calls
+        units are in hertz
+        """
+        self.load_freq_list(freqs_hz)
+        self.configure_list_sweep()
+
+
+    def stop_rf_frequency_sweep(self):
+        """
+        returns to a fixed (CW) frequency after set_rf_frequency_sweep
+        """
+        SG = self._sg
+        SG.write(':FREQ:MODE CW')
+
+
+    def set_pulse_gate(self, on):
+        """
+        gates the RF output with the external pulse modulation input (rear panel PULSE IN, high = RF on)
+        so the RF can be switched on and off by a pulse sequence instead of set_rf_toggle writes
+        """
+        SG = self._sg
+        state = 'ON' if on else 'OFF'
+        SG.write(f':PULM:SOUR EXT;:PULM:STAT {state};:OUTP:MOD {state}')
+
     
     def get_lf_frequency(self):
         """
         signal frequency 0.5Hz-1MHz
         """
-        SG = self.SG_Connect()
+        SG = self._sg
         return float(SG.query('LFO:FUNC:FREQ?'))
     
     
     def set_lf_frequency(self,value):
-        SG = self.SG_Connect()
+        SG = self._sg
         SG.write('LFO:FUNC:FREQ {:.2f}'.format(value))
     
     #ALL EXCEPT MODEL UNR
@@ -148,12 +234,12 @@ class AgilentE8257D:
         RF offset
         units are dB
         """
-        SG = self.SG_Connect()
+        SG = self._sg
         return float(SG.query('POW:OFFS?'))
     
     
     def set_rf_offset(self,value):
-        SG = self.SG_Connect()
+        SG = self._sg
         SG.write('POW:OFFS {:.2f}'.format(value))
     
     
@@ -162,12 +248,12 @@ class AgilentE8257D:
         carrier phase
         from -Pi to Pi
         """
-        SG = self.SG_Connect()
+        SG = self._sg
         return float(SG.query('PHAS?'))
     
     
     def set_phase(self,value):
-        SG = self.SG_Connect()
+        SG = self._sg
         SG.write('PHAS {:.2f}'.format(value))
     
     
@@ -175,7 +261,7 @@ class AgilentE8257D:
         """
         sets current output phase as a zero reference
         """
-        SG = self.SG_Connect()
+        SG = self._sg
         SG.write('PHAS:REF')
 
     
@@ -183,14 +269,71 @@ class AgilentE8257D:
         """
         Modulation State
         """
-        SG = self.SG_Connect()
+        SG = self._sg
         return float(SG.query('OUTP:MOD?'))
         
     
     def set_mod_toggle(self, value):
-        SG = self.SG_Connect()
+        SG = self._sg
         SG.write('OUTP:MOD {}'.format(value))
 
+
+    # SCPI queries/commands for get_state/set_state, in reply order
+    STATE_QUERIES = {
+        'rf_freq': 'FREQ?',
+        'rf_amp': ':POW:AMPL?',
+        'rf_toggle': ':OUTP:STAT?',
+        'lf_amp': ':LFO:AMPL?',
+        'lf_toggle': ':LFO:STAT?',
+        'mod_toggle': ':OUTP:MOD?',
+    }
+    STATE_COMMANDS = {
+        'rf_freq': ':FREQ {:.2f}',
+        'rf_amp': ':POW:AMPL {:.2f}',
+        'rf_toggle': ':OUTP:STAT {:s}',
+        'lf_amp': ':LFO:AMPL {:.2f}',
+        'lf_toggle': ':LFO:STAT {:s}',
+        'mod_toggle': ':OUTP:MOD {:s}',
+    }
+
+    def get_state(self):
+        """
+        Reads back the RF/LF frequency, amplitude and output states in one compound
+        SCPI query (a single round-trip instead of one per parameter)
+        rf_freq is in hertz, amplitudes are in dBm, toggles are 0 or 1
+        """
+        SG = self._sg
+        reply = SG.query(';'.join(self.STATE_QUERIES.values()))
+        return {key: float(val) for key, val in zip(self.STATE_QUERIES, reply.split(';'))}
+
+
+    def set_state(self, **kwargs):
+        """
+        Sets any of rf_freq, rf_amp, rf_toggle, lf_amp, lf_toggle, mod_toggle
+        (same keys and units as get_state) with one compound SCPI write
+        toggles accept 'ON'/'OFF' or anything truthy/falsy
+        """
+        cmds = []
+        for key, value in kwargs.items():
+            if key not in self.STATE_COMMANDS:
+                raise ValueError(f'Unknown E8257D state [{key}], must be one of {list(self.STATE_COMMANDS)}')
+            if key.endswith('_toggle') and not isinstance(value, str):
+                value = 'ON' if value else 'OFF'
+            cmds.append(self.STATE_COMMANDS[key].format(value))
+        if cmds:
+            SG = self._sg
+            SG.write(';'.join(cmds))
+
+
+    def program(self, frequency_hz, amplitude_dbm, on=False):
+        """
+        Sets the RF frequency (hertz), amplitude (dBm) and output state in one compound
+        SCPI message ending in *OPC?, so it only returns once the instrument has applied
+        all three (one round-trip)
+        """
+        SG = self._sg
+        SG.query(f":FREQ {frequency_hz:.6e};:POW:AMPL {amplitude_dbm:.3f};:OUTP:STAT {'ON' if on else 'OFF'};*OPC?")
+
 #   ONLY WITH OPTION 002/602    
 #    @Feat()
 #    def mod_type(self):
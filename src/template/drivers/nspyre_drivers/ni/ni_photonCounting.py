@@ -17,10 +17,20 @@ from nidaqmx.constants import Edge, READ_ALL_AVAILABLE, TaskMode, TriggerType, A
 from nidaqmx.stream_readers import CounterReader
 from nidaqmx.stream_readers import AnalogSingleChannelReader 
 
+# module-level aliases so task configuration doesn't walk the nidaqmx.constants attribute chain every time
+_RISING = Edge.RISING
+_FINITE = AcquisitionType.FINITE
+_CONTINUOUS = AcquisitionType.CONTINUOUS
+
 from contextlib import ExitStack
+from collections import OrderedDict
+from queue import SimpleQueue, Empty
 
 class NIDAQ():
 
+    # number of (acq_rate, num_samples) task configurations kept committed on the DAQ
+    TASK_CACHE_SIZE = 4
+
     def __init__(self):
         pass
         
@@ -32,56 +42,185 @@ class NIDAQ():
         self.clk_channel = '/Dev1/PFI2' # ctr 2
         self.dev_channel = '/Dev1/PFI0' # ctr 1
 
+        # (acq_rate, num_samples) -> (task, reader, buffer), least recently used first
+        self._task_cache = OrderedDict()
 
-    def read_ctrs_ext_clk(self, acq_rate, num_samples):
+        # continuous counting task started by start_ctrs_continuous, if any
+        self._stream_task = None
+
+
+    def __enter__(self):
+        return self
 
-        # applying user's acquisition rate
-        self.sampling_rate = acq_rate
-        self.period = 1 / self.sampling_rate
 
-        # empty counts
-        counts = []
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self):
+        '''Close every cached DAQ task'''
+        self.stop_ctrs_continuous()
+        while self._task_cache:
+            _, (task, _, _) = self._task_cache.popitem()
+            task.close()
+
+
+    def _ext_clk_task(self, acq_rate, num_samples):
+        '''Returns a committed (task, reader, buffer) for this acquisition, creating it on first use
+        so repeated acquisitions with the same settings skip task creation and configuration'''
+        key = (acq_rate, num_samples)
+        if key in self._task_cache:
+            self._task_cache.move_to_end(key)
+            return self._task_cache[key]
 
         # creating DAQ task  
-        self.read_task = nidaqmx.Task()
+        read_task = nidaqmx.Task()
         
         # adding digital input channel as counter (APD)
-        self.read_task.ci_channels.add_ci_count_edges_chan(f'/Dev1/ctr1')
+        read_task.ci_channels.add_ci_count_edges_chan(f'/Dev1/ctr1')
 
         # connecting physical input to virtual counter
-        self.read_task.ci_channels.all.ci_count_edges_term = '/Dev1/PFI0'
+        read_task.ci_channels.all.ci_count_edges_term = '/Dev1/PFI0'
 
         # setting up timing clock (external)
-        self.read_task.timing.cfg_samp_clk_timing(
-                                self.sampling_rate,
+        read_task.timing.cfg_samp_clk_timing(
+                                acq_rate,
                                 source = '/Dev1/PFI2',
-                                active_edge = nidaqmx.constants.Edge.RISING,
-                                sample_mode = nidaqmx.constants.AcquisitionType.FINITE,
+                                active_edge = _RISING,
+                                sample_mode = _FINITE,
                                 samps_per_chan = num_samples
         )
 
+        # reserve and commit the task so later starts don't reconfigure the hardware
+        read_task.control(TaskMode.TASK_COMMIT)
+
         # creating counter stream object for counting
-        self.reader_stream = CounterReader(self.read_task.in_stream)
+        reader_stream = CounterReader(read_task.in_stream)
+        # the buffer is sized for the task, so skip the per-read shape check (it queries in_stream channels from the driver)
+        reader_stream.verify_array_shape = False
+
+        self._task_cache[key] = (read_task, reader_stream, np.empty(num_samples, dtype=np.uint32))
+        if len(self._task_cache) > self.TASK_CACHE_SIZE:
+            _, (old_task, _, _) = self._task_cache.popitem(last=False)
+            old_task.close()
+        return self._task_cache[key]
+
+
+    def start_ctrs_ext_clk(self, acq_rate, num_samples):
+        '''Arms the counter for num_samples externally clocked samples without waiting for them,
+        so the clock source (e.g. a Swabian sequence) can be started afterwards. Collect with finish_ctrs_ext_clk'''
+        # args can arrive as netrefs when called through the InstrumentGateway, make them local once
+        acq_rate = obtain(acq_rate)
+        num_samples = obtain(num_samples)
+
+        # applying user's acquisition rate
+        self.sampling_rate = acq_rate
+        self.period = 1 / self.sampling_rate
+
+        self.read_task, self.reader_stream, self._raw_counts = self._ext_clk_task(acq_rate, num_samples)
         
         # starting counting task
         self.read_task.start()
 
+
+    def finish_ctrs_ext_clk(self, timeout=None):
+        '''Waits for the acquisition armed by start_ctrs_ext_clk and returns the difference in counts between each
+        clock edge, as a single row. timeout (s) defaults to the number of samples times the period, plus 1s'''
+        raw_counts = self._raw_counts
+        num_samples = raw_counts.size
+        if timeout is None:
+            timeout = num_samples * self.period + 1
+
         # reading counter out starting with the buffer
-        raw_counts = np.zeros(num_samples, dtype=np.uint32) + 1
+        # every sample is read, so the buffer is fully overwritten and needs no initial fill
         self.reader_stream.read_many_sample_uint32(
                                 raw_counts,
-                                number_of_samples_per_channel = nidaqmx.constants.READ_ALL_AVAILABLE,
-                                timeout = 0 #num_samples * self.period + 1
+                                number_of_samples_per_channel = num_samples,
+                                timeout = obtain(timeout)
         )
             
         self.read_task.stop()
-        self.read_task.close()
             
-        # calculate difference in counts between each period
-        counts.append(np.diff(raw_counts))
-        return np.array(counts)
+        # calculate difference in counts between each period, as a single row
+        return np.ascontiguousarray(np.diff(raw_counts)[np.newaxis, :])
 
-       
 
+    def read_ctrs_ext_clk(self, acq_rate, num_samples):
+        '''start_ctrs_ext_clk then finish_ctrs_ext_clk. Returns an array of shape (1, num_samples-1),
+        so a single count (num_samples=2) is read(...)[0][0], not the whole returned array'''
+        self.start_ctrs_ext_clk(acq_rate, num_samples)
+        return self.finish_ctrs_ext_clk()
+
+
+    def start_ctrs_continuous(self, acq_rate, chunk_samples, num_slots=4):
+        '''Starts counting continuously on the external clock and keeps counting until stop_ctrs_continuous.
+        Every chunk_samples clock edges the driver calls back, the chunk is differenced into the next of
+        num_slots preallocated rows and handed to next_ctrs_chunk, so the task is only started once however
+        many chunks (e.g. sweeps) are collected, and each chunk is read while the next one is being clocked in'''
+        acq_rate = obtain(acq_rate)
+        chunk_samples = obtain(chunk_samples)
+        num_slots = obtain(num_slots)
+        self.stop_ctrs_continuous()
 
-    
+        self.sampling_rate = acq_rate
+        self.period = 1 / self.sampling_rate
+
+        # same channel and clock set up as _ext_clk_task, only the sample mode differs
+        stream_task = nidaqmx.Task()
+        stream_task.ci_channels.add_ci_count_edges_chan(f'/Dev1/ctr1')
+        stream_task.ci_channels.all.ci_count_edges_term = '/Dev1/PFI0'
+        stream_task.timing.cfg_samp_clk_timing(
+                                acq_rate,
+                                source = '/Dev1/PFI2',
+                                active_edge = _RISING,
+                                sample_mode = _CONTINUOUS,
+                                samps_per_chan = chunk_samples
+        )
+        # room in the driver buffer for as many chunks as there are slots
+        stream_task.in_stream.input_buf_size = chunk_samples*num_slots
+
+        reader_stream = CounterReader(stream_task.in_stream)
+        reader_stream.verify_array_shape = False
+        raw_counts = np.empty(chunk_samples, dtype=np.uint32)
+        # each chunk's differences between clock edges, reused round robin
+        self._chunk_slots = np.empty((num_slots, chunk_samples-1), dtype=np.uint32)
+        self._ready_slots = SimpleQueue()
+        self._chunks_read = 0
+        self._chunks_taken = 0
+
+        def _on_chunk(task_handle, event_type, num_samples, callback_data):
+            # runs on the nidaqmx callback thread
+            reader_stream.read_many_sample_uint32(raw_counts, number_of_samples_per_channel = chunk_samples)
+            slot = self._chunks_read % num_slots
+            np.subtract(raw_counts[1:], raw_counts[:-1], out=self._chunk_slots[slot])
+            self._chunks_read += 1
+            self._ready_slots.put(slot)
+            return 0
+
+        stream_task.register_every_n_samples_acquired_into_buffer_event(chunk_samples, _on_chunk)
+        stream_task.start()
+        self._stream_task = stream_task
+
+
+    def next_ctrs_chunk(self, timeout=None):
+        '''Returns the next chunk of counts from start_ctrs_continuous, the differences in counts between its
+        clock edges as a single row. The row is a view that is reused num_slots chunks later, so copy it out
+        before then. timeout (s) defaults to the chunk length times the period, plus 1s'''
+        if timeout is None:
+            timeout = self._chunk_slots.shape[1] * self.period + 1
+        try:
+            slot = self._ready_slots.get(timeout=obtain(timeout))
+        except Empty:
+            raise TimeoutError(f'No DAQ chunk within {timeout}s, check the external clock') from None
+        self._chunks_taken += 1
+        if self._chunks_read - self._chunks_taken >= len(self._chunk_slots):
+            raise RuntimeError('DAQ chunks were overwritten before being read, use more slots or read them faster')
+        return self._chunk_slots[slot][np.newaxis, :]
+
+
+    def stop_ctrs_continuous(self):
+        '''Stops and closes the task started by start_ctrs_continuous, if one is running'''
+        stream_task, self._stream_task = self._stream_task, None
+        if stream_task is not None:
+            stream_task.stop()
+            stream_task.close()
@@ -13,10 +13,72 @@ The driver gets called whenever needed purely as a python file to communicate wi
 
 
 
+from concurrent.futures import ThreadPoolExecutor
+import ctypes
+
 import numpy as np
 import nidaqmx
 from nidaqmx.stream_readers import CounterReader
 from nidaqmx.constants import Edge, TriggerType, TaskMode, AcquisitionType, READ_ALL_AVAILABLE
+from rpyc.utils.classic import obtain
+
+# module-level aliases so task configuration doesn't walk the nidaqmx.constants attribute chain every time
+_RISING = Edge.RISING
+_FINITE = AcquisitionType.FINITE
+_CONTINUOUS = AcquisitionType.CONTINUOUS
+_READ_ALL = READ_ALL_AVAILABLE
+
+
+# DAQmx C library names to try for the fast read path, first one that loads wins
+_DAQMX_LIBS = ('nicaiu',) if hasattr(ctypes, 'WinDLL') else ('libnidaqmx.so', 'libnidaqmx.so.1')
+# private DAQmxReadCounterU32 pointer, loaded on the first fast_read_samples. False once it's known to be unusable
+_read_counter_u32 = None
+
+
+def _load_read_counter_u32():
+    '''Binds a private DAQmxReadCounterU32 function pointer from the DAQmx C library, or None if it can't be loaded.
+    nidaqmx shares one function object per C function and sets its argtypes to its own ndpointer wrappers
+    on first use, so this gets a separate pointer from a separate library handle with its own argtypes'''
+    for lib_name in _DAQMX_LIBS:
+        try:
+            lib = ctypes.WinDLL(lib_name) if hasattr(ctypes, 'WinDLL') else ctypes.CDLL(lib_name)
+            read_counter_u32 = lib['DAQmxReadCounterU32']
+        except (OSError, AttributeError):
+            continue
+        # TaskHandle, numSampsPerChan, timeout, readArray, arraySizeInSamps, sampsPerChanRead, reserved
+        read_counter_u32.argtypes = [ctypes.c_void_p, ctypes.c_int32, ctypes.c_double, ctypes.POINTER(ctypes.c_uint32),
+                                     ctypes.c_uint32, ctypes.POINTER(ctypes.c_int32), ctypes.POINTER(ctypes.c_uint32)]
+        read_counter_u32.restype = ctypes.c_int32
+        return read_counter_u32
+    return None
+
+
+def _get_read_counter_u32():
+    '''Returns the private DAQmxReadCounterU32 pointer, loading it on first use, or None if the fast path is unavailable'''
+    global _read_counter_u32
+    if _read_counter_u32 is None:
+        _read_counter_u32 = _load_read_counter_u32() or False
+    return _read_counter_u32 or None
+
+
+def _disable_fast_read():
+    '''Stops fast_read_samples from trying the C function again, e.g. after this nidaqmx turned out not to fit it'''
+    global _read_counter_u32
+    _read_counter_u32 = False
+
+
+def _fast_read(read_counter_u32, task, buf, timeout):
+    '''Reads len(buf) counter samples from task into the uint32 array buf with a single DAQmxReadCounterU32 call,
+    skipping the property lookups the stream reader does on every read.
+    Uses the private task._handle, so raises AttributeError if nidaqmx no longer has it'''
+    samps_read = ctypes.c_int32()
+    handle = task._handle
+    error_code = read_counter_u32(getattr(handle, 'value', handle), buf.size, timeout,
+                                buf.ctypes.data_as(ctypes.POINTER(ctypes.c_uint32)), buf.size,
+                                ctypes.byref(samps_read), None)
+    if error_code < 0:
+        raise nidaqmx.errors.DaqError(f'DAQmxReadCounterU32 failed on task {task.name}', error_code, task_name=task.name)
+    return samps_read.value
 
 from contextlib import ExitStack
 
@@ -25,28 +87,50 @@ class TreelessNIDAQ():
     CLK_CHANNEL = '/Dev1/PFI2'     # external clock from the Swabian
     APD_CHANNEL = '/Dev1/PFI0'     # TTL-ish clicks from the APD
     FLAG_CHANNEL = '/Dev1/PFI3'     # clicks to signal the start of experiment (or other need, but pulse seq-defined)
+    MIN_INPUT_BUF_SIZE = 1 << 20    # smallest DAQmx input buffer (samples) for the swab-timed read tasks
 
     def __init__(self):
-        pass
+        # committed tasks kept between readCtr_singleRead_intClk calls, (acqRate, ctrChan) -> (clkTask, ctrTask, reader, buffer)
+        # only one configuration at a time since they all use ctr0
+        self._single_cache = {}
+        # number of samples the swab-timed read buffers are currently allocated for
+        self._num_samples = None
 
 
     def __enter__(self):
         self.read_tasks = []
         self.reader_streams = []
+        # one worker per counter so both can be read out at the same time (DAQmx releases the GIL while reading)
+        self._pool = ThreadPoolExecutor(max_workers=2)
         return self
     
 
     def __exit__(self, *args):  # execute when the DAQ object gets killed unexpectedly, for example, when the STOP button is clicked.
         if len(self.read_tasks) != 0:  # in case the DAQ object was killed before the reading was over, close and destroy all read tasks
-            for read_task, reader_stream in zip(self.read_tasks, self.reader_streams):
-                # print('in if')
-                read_task.stop()
-                read_task.close()
-                self.read_tasks.remove(read_task)
-                self.reader_streams.remove(reader_stream)
+            self._close_read_tasks()
+        self._close_single_read_tasks()
+        self._pool.shutdown()
+
+
+    def _close_read_tasks(self):
+        '''Stops and closes every read task (removing tasks from the list while iterating over it would skip every other one)'''
+        for read_task in self.read_tasks:
+            read_task.stop()
+            read_task.close()
+        self.read_tasks.clear()
+        self.reader_streams.clear()
+
+
+    def _close_single_read_tasks(self):
+        '''Closes the tasks cached by readCtr_singleRead_intClk, freeing ctr0 for other tasks'''
+        for dummyClkTask, photonReadTask, _, _ in self._single_cache.values():
+            photonReadTask.close()
+            dummyClkTask.close()
+        self._single_cache.clear()
 
 
     def start_read_tasks_swabTimed(self, num_samples, trig_channel=FLAG_CHANNEL):     # create read task, set up counter, source clock and reader stream.
+        self._close_single_read_tasks()
         self.read_tasks = []
         # creating DAQ tasks  
         photonReadTask = nidaqmx.Task()
@@ -59,12 +143,14 @@ class TreelessNIDAQ():
         photonReadTask.timing.cfg_samp_clk_timing(
                                 20e6,   # max DAQ sampling rate for convenience
                                 source = self.CLK_CHANNEL, # Swabian clock ticks
-                                active_edge=nidaqmx.constants.Edge.RISING,
-                                sample_mode = nidaqmx.constants.AcquisitionType.FINITE,
+                                active_edge=_RISING,
+                                sample_mode = _FINITE,
                                 samps_per_chan = num_samples, # number of ticks to be collected
         )
+        # DAQmx sizes the buffer from samps_per_chan heuristically, give DMA headroom at 20MHz to avoid overflow errors (-200361)
+        photonReadTask.in_stream.input_buf_size = max(num_samples * 4, self.MIN_INPUT_BUF_SIZE)
         photonReadTask.triggers.arm_start_trigger.trig_type = TriggerType.DIGITAL_EDGE
-        photonReadTask.triggers.arm_start_trigger.dig_edge_edge = Edge.RISING
+        photonReadTask.triggers.arm_start_trigger.dig_edge_edge = _RISING
         photonReadTask.triggers.arm_start_trigger.dig_edge_src = trig_channel
         photonReadTask.control(TaskMode.TASK_COMMIT) #helps to initialize all tasks at once
 
@@ -77,74 +163,136 @@ class TreelessNIDAQ():
         trackingTask.timing.cfg_samp_clk_timing(
                         20e6,
                         source=self.CLK_CHANNEL,
-                        active_edge=nidaqmx.constants.Edge.RISING,
-                        sample_mode=nidaqmx.constants.AcquisitionType.FINITE,
+                        active_edge=_RISING,
+                        sample_mode=_FINITE,
                         samps_per_chan=num_samples,
                     )
+        trackingTask.in_stream.input_buf_size = max(num_samples * 4, self.MIN_INPUT_BUF_SIZE)
         trackingTask.triggers.arm_start_trigger.trig_type = TriggerType.DIGITAL_EDGE
-        trackingTask.triggers.arm_start_trigger.dig_edge_edge = Edge.RISING
+        trackingTask.triggers.arm_start_trigger.dig_edge_edge = _RISING
         trackingTask.triggers.arm_start_trigger.dig_edge_src = trig_channel
         trackingTask.control(TaskMode.TASK_COMMIT)
 
         # creating counter stream object for counting
         self.reader_streams = [nidaqmx.stream_readers.CounterReader(photonReadTask.in_stream),
                                nidaqmx.stream_readers.CounterReader(trackingTask.in_stream)]
+        # the buffers are sized for the tasks, so skip the per-read shape check (it queries in_stream channels from the driver)
+        for reader_stream in self.reader_streams:
+            reader_stream.verify_array_shape = False
+        # preallocate the raw read buffers
+        # every element is overwritten by each read, so they're only reallocated when num_samples changes
+        if self._num_samples != num_samples:
+            self._photonBuf = np.empty(num_samples, dtype=np.uint32)
+            self._trackingBuf = np.empty(num_samples, dtype=np.uint32)
+            self._num_samples = num_samples
         # starting counting task
         photonReadTask.start()
         trackingTask.start()
 
 
-    def read_samples(self, num_samples): 
+    def _check_read_args(self, num_samples, timeout):
+        '''Makes read_samples/fast_read_samples args local and fills in the default timeout'''
+        # args can arrive as netrefs when called through the InstrumentGateway, make them local once
+        num_samples = obtain(num_samples)
+        timeout = obtain(timeout)
+        if timeout is None:
+            timeout = num_samples/20e6 + 1.0
+        if num_samples != self._num_samples:
+            raise ValueError(f'read_samples({num_samples}) does not match the {self._num_samples} samples the read tasks were started with')
+        return num_samples, timeout
 
-        # reading out the counters
-        photonCts = np.zeros(num_samples, dtype=np.uint32)
-        trackingCts = np.zeros(num_samples, dtype=np.uint32)
-        # read the counts out of the buffer
-        self.reader_streams[0].read_many_sample_uint32(photonCts,
-                                    number_of_samples_per_channel=nidaqmx.constants.READ_ALL_AVAILABLE,
-                                    timeout=nidaqmx.constants.WAIT_INFINITELY)
-        self.reader_streams[1].read_many_sample_uint32(trackingCts,
-                                    number_of_samples_per_channel=nidaqmx.constants.READ_ALL_AVAILABLE,
-                                    timeout=nidaqmx.constants.WAIT_INFINITELY)
-        
 
-        for read_task, reader_stream in zip(self.read_tasks, self.reader_streams):
-            read_task.stop()
-            read_task.close()
-            self.read_tasks.remove(read_task)
-            self.reader_streams.remove(reader_stream)
+    def _diff_read_bufs(self):
+        '''Closes the read tasks and returns the counts/flags per clock tick from the raw read buffers'''
+        self._close_read_tasks()
 
-        # calculate difference in counts between consecutive clock ticks
-        counts = np.diff(photonCts)
-        flags = np.diff(trackingCts)
+        # calculate difference in counts between consecutive clock ticks (same result as np.diff)
+        # into new arrays, so the results stay valid after the raw buffers are reused by the next read
+        photonCts = self._photonBuf
+        trackingCts = self._trackingBuf
+        counts = np.subtract(photonCts[1:], photonCts[:-1])
+        flags = np.subtract(trackingCts[1:], trackingCts[:-1])
 
         return counts, flags
 
 
+    def read_samples(self, num_samples, timeout=None): 
+        '''Reads exactly num_samples clock ticks from both counters.
+        Arguments:  *num_samples, number of ticks the read tasks were started with
+                    *timeout (s), how long to wait for all of the ticks. Default (None) is the time num_samples take 
+                     at the max DAQ sampling rate plus 1s, so pass the expected sequence duration for slow sequences'''
+        num_samples, timeout = self._check_read_args(num_samples, timeout)
+
+        # reading out the counters into the buffers from start_read_tasks_swabTimed
+        # read the counts out of the buffer, a known read length lets DAQmx do a single transfer
+        # and a finite timeout surfaces a stalled pulse sequence instead of hanging forever
+        # both counters have their data ready at the same time, so read them in parallel
+        photonRead = self._pool.submit(self.reader_streams[0].read_many_sample_uint32, self._photonBuf,
+                                    number_of_samples_per_channel=num_samples,
+                                    timeout=timeout)
+        trackingRead = self._pool.submit(self.reader_streams[1].read_many_sample_uint32, self._trackingBuf,
+                                    number_of_samples_per_channel=num_samples,
+                                    timeout=timeout)
+        photonRead.result()
+        trackingRead.result()
+
+        return self._diff_read_bufs()
+
+
+    def fast_read_samples(self, num_samples, timeout=None):
+        '''Same as read_samples, but reads through DAQmxReadCounterU32 directly instead of the nidaqmx stream readers.
+        Falls back to read_samples (and keeps using it) if the C library can't be loaded,
+        ctypes rejects the arguments or nidaqmx no longer has the task attributes this relies on'''
+        read_counter_u32 = _get_read_counter_u32()
+        if read_counter_u32 is None:
+            return self.read_samples(num_samples, timeout)
+        num_samples, timeout = self._check_read_args(num_samples, timeout)
+
+        # ctypes drops the GIL during the C call, so both reads still run in parallel
+        photonRead = self._pool.submit(_fast_read, read_counter_u32, self.read_tasks[0], self._photonBuf, timeout)
+        trackingRead = self._pool.submit(_fast_read, read_counter_u32, self.read_tasks[1], self._trackingBuf, timeout)
+        try:
+            photonRead.result()
+            trackingRead.result()
+        except (ctypes.ArgumentError, AttributeError):
+            trackingRead.exception() # let the other read finish before redoing both
+            # both fail before DAQmx is called, so no samples were consumed and the normal read can redo it
+            _disable_fast_read()
+            return self.read_samples(num_samples, timeout)
+
+        return self._diff_read_bufs()
+
+
+    def _config_intClk_tasks(self, dummyClkTask, photonReadTask, acqRate, num_samples, ctrChan):
+        '''Configures a dummy di task to generate a di/SampleClock@acqRate and a ctr0 task clocked by it'''
+        # create a digital input dummy task to start the di/SampleClock@acqRate for clocking the counter input task
+        dummyClkTask.di_channels.add_di_chan('Dev1/port0')
+        dummyClkTask.timing.cfg_samp_clk_timing(acqRate, sample_mode=_CONTINUOUS)
+        dummyClkTask.control(TaskMode.TASK_COMMIT)
+
+        # adding digital input channel as counter (APD)
+        photonReadTask.ci_channels.add_ci_count_edges_chan('/Dev1/ctr0')
+        # connecting physical input to virtual counter
+        photonReadTask.ci_channels.all.ci_count_edges_term = ctrChan
+        # setting up timing clock (external)
+        photonReadTask.timing.cfg_samp_clk_timing(
+                                acqRate, 
+                                source = '/Dev1/di/SampleClock', #internal sample clock
+                                active_edge=_RISING,
+                                sample_mode = _FINITE,
+                                samps_per_chan = num_samples, # number of ticks to be collected
+        )
+
+
     def readCtr_multiRead_intClk(self, acqRate, num_samples:int, ctrChan=APD_CHANNEL): #only kept from legacy for TvT
         '''Reads specified counter channels for a given acqRate, a designated number of times (based off internal timing)'''
+        self._close_single_read_tasks()
 
         num_samples += 1 #so np.diff works later. Also, a DAQ buffer size of 1 isn't supported
 
         #create DAQ tasks
         with nidaqmx.Task() as dummyClkTask, nidaqmx.Task() as photonReadTask:
-            # create a digital input dummy task to start the di/SampleClock@acqRate for clocking the counter input task
-            dummyClkTask.di_channels.add_di_chan('Dev1/port0')
-            dummyClkTask.timing.cfg_samp_clk_timing(acqRate, sample_mode=AcquisitionType.CONTINUOUS)
-            dummyClkTask.control(TaskMode.TASK_COMMIT)
-
-            # adding digital input channel as counter (APD)
-            photonReadTask.ci_channels.add_ci_count_edges_chan('/Dev1/ctr0')
-            # connecting physical input to virtual counter
-            photonReadTask.ci_channels.all.ci_count_edges_term = ctrChan
-            # setting up timing clock (external)
-            photonReadTask.timing.cfg_samp_clk_timing(
-                                    acqRate, 
-                                    source = '/Dev1/di/SampleClock', #internal sample clock
-                                    active_edge=nidaqmx.constants.Edge.RISING,
-                                    sample_mode = nidaqmx.constants.AcquisitionType.FINITE,
-                                    samps_per_chan = num_samples, # number of ticks to be collected
-            )
+            self._config_intClk_tasks(dummyClkTask, photonReadTask, acqRate, num_samples, ctrChan)
 
             #connect buffer to a reader
             photonReader = nidaqmx.stream_readers.CounterReader(photonReadTask.in_stream)
@@ -157,14 +305,34 @@ class TreelessNIDAQ():
             ctrRawCts = np.zeros(num_samples, dtype=np.uint32)
             # read the counts out of the buffer
             photonReader.read_many_sample_uint32(ctrRawCts,
-                                            number_of_samples_per_channel=nidaqmx.constants.READ_ALL_AVAILABLE,
+                                            number_of_samples_per_channel=_READ_ALL,
                                             timeout=num_samples/acqRate + 1) #1s overhead should be fine
                 
         return np.diff(ctrRawCts)
     
 
     def readCtr_singleRead_intClk(self, acqRate, ctrChan=APD_CHANNEL): #only kept from legacy for TvT
-        return(self.readCtr_multiRead_intClk(acqRate, 1, ctrChan))
+        '''Reads specified counter channel once for a given acqRate. The committed tasks are kept around
+        so repeated reads with the same acqRate and ctrChan are just a start/read/stop'''
+        key = (acqRate, ctrChan)
+        if key not in self._single_cache:
+            self._close_single_read_tasks()
+            dummyClkTask, photonReadTask = nidaqmx.Task(), nidaqmx.Task()
+            self._config_intClk_tasks(dummyClkTask, photonReadTask, acqRate, 2, ctrChan) #2 ticks so np.diff gives one sample
+            photonReadTask.control(TaskMode.TASK_COMMIT)
+            photonReader = nidaqmx.stream_readers.CounterReader(photonReadTask.in_stream)
+            photonReader.verify_array_shape = False #buffer below always matches the task
+            self._single_cache[key] = (dummyClkTask, photonReadTask, photonReader, np.empty(2, dtype=np.uint32))
+        dummyClkTask, photonReadTask, photonReader, ctrRawCts = self._single_cache[key]
+
+        photonReadTask.start()
+        dummyClkTask.start()
+        photonReader.read_many_sample_uint32(ctrRawCts,
+                                        number_of_samples_per_channel=2,
+                                        timeout=2/acqRate + 1) #1s overhead should be fine
+        photonReadTask.stop()
+        dummyClkTask.stop()
+        return np.diff(ctrRawCts)
 
 
     
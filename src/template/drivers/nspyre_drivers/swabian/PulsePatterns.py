@@ -7,20 +7,136 @@ All rights reserved.
 This work is licensed under the terms of the 3-Clause BSD license.
 For a copy, see <https://opensource.org/licenses/BSD-3-Clause>.
 '''
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import chain
+
+import numpy as np
 from pulsestreamer import Sequence
 
 
 
+NUM_DIG_CHANS = 8 #Swabian digital outputs D0-D7
+
+
+def chanMask(chans):
+    '''Returns the digital channel set of a step as an int bitmask (bit k set => channel k on)
+    Arguments:  *chans, list/tuple of digital channel numbers, or an int bitmask which is passed through as is'''
+    if isinstance(chans, (int, np.integer)):
+        return(int(chans))
+    mask = 0
+    for chan in chans:
+        mask |= 1 << chan
+    return(mask)
+
+
+def _expandMasks(masks, chanBits):
+    '''Expands step bitmasks into a (len(chanBits) x len(masks)) uint8 matrix of 0/1 on-states, one row per channel, in a single broadcast'''
+    return( ((masks[np.newaxis, :] >> chanBits[:, np.newaxis]) & 1).astype(np.uint8) )
+
+
+def _maskChans(mask:int):
+    '''Inverse of chanMask, returns the tuple of digital channels set in mask'''
+    return( tuple(chan for chan in range(NUM_DIG_CHANS) if (mask >> chan) & 1) )
+
+
+@dataclass
+class SeqArr:
+    '''Struct-of-arrays form of an RLE sequence [ (Duration in ns, [Dig Chans to Turn On], A0, A1), ...], one array per field,
+    so long sequences can be concatenated and converted without going through a Python object per step.
+    Use fromRLE/toRLE to go between the two, the Swabian (and every Pulses method) still takes/returns RLE lists'''
+    durs: np.ndarray #int64, step durations (in ns)
+    masks: np.ndarray #uint32, chanMask of the digital channels on during each step
+    a0: np.ndarray #float64, A0 voltage of each step (in V)
+    a1: np.ndarray #float64, A1 voltage of each step (in V)
+
+    @classmethod
+    def fromRLE(cls, RLEseq):
+        '''Builds a SeqArr from an RLE sequence (digital channels can be lists/tuples or chanMasks)'''
+        RLEseq = RLEseq if isinstance(RLEseq, (list, tuple)) else list(RLEseq)
+        numSteps = len(RLEseq)
+        return(cls(durs=np.fromiter((step[0] for step in RLEseq), dtype=np.int64, count=numSteps),
+                   masks=np.fromiter((chanMask(step[1]) for step in RLEseq), dtype=np.uint32, count=numSteps),
+                   a0=np.fromiter((step[2] for step in RLEseq), dtype=np.float64, count=numSteps),
+                   a1=np.fromiter((step[3] for step in RLEseq), dtype=np.float64, count=numSteps)))
+
+    def toRLE(self):
+        '''Returns the RLE sequence [ (Duration in ns, (Dig Chans to Turn On), A0, A1), ...] this SeqArr represents'''
+        chansOfMask = {mask: _maskChans(mask) for mask in np.unique(self.masks).tolist()}
+        return( [(dur, chansOfMask[mask], a0, a1) for dur, mask, a0, a1 
+                    in zip(self.durs.tolist(), self.masks.tolist(), self.a0.tolist(), self.a1.tolist())] )
+
+    @classmethod
+    def concat(cls, seqArrs):
+        '''Plays every SeqArr in seqArrs back to back, with one concatenate per field (chaining + copies the front of the sequence again for every part)'''
+        seqArrs = list(seqArrs)
+        return(cls(durs=np.concatenate([part.durs for part in seqArrs]), masks=np.concatenate([part.masks for part in seqArrs]),
+                   a0=np.concatenate([part.a0 for part in seqArrs]), a1=np.concatenate([part.a1 for part in seqArrs])))
+
+    def toSequence(self, withAnalog=True):
+        '''Returns the Swabian Sequence this SeqArr represents, only leaving array form at the setDigital/setAnalog calls
+        Arguments:  *withAnalog (default True), also set the A0/A1 patterns (False is the same as convertDigRLEtoSeq)'''
+        swabSeq = Sequence()
+        for chan, chanPulsePattern in _digPatterns(self.durs, self.masks).items():
+            swabSeq.setDigital(chan, chanPulsePattern)
+        if withAnalog:
+            durs = self.durs.tolist()
+            swabSeq.setAnalog(0, list(zip(durs, self.a0.tolist())))
+            swabSeq.setAnalog(1, list(zip(durs, self.a1.tolist())))
+        return(swabSeq)
+
+    def getDuration(self):
+        '''Total duration (in ns) of the sequence, same as the Swabian Sequence's getDuration but without building one'''
+        return(int(self.durs.sum()))
+
+    def __len__(self):
+        return(self.durs.size)
+
+    def __add__(self, other):
+        '''Plays self then other'''
+        if not isinstance(other, SeqArr):
+            return(NotImplemented)
+        return(SeqArr.concat((self, other)))
+
+
+def _digPatterns(durs, masks):
+    '''Array kernel shared by both converters, turns step durations (int64) and chanMasks (uint32) into
+    {chan: [(dur, 1 if chan is on in step else 0), ...]} for every digital channel that gets used'''
+    usedMask = int(np.bitwise_or.reduce(masks)) if masks.size else 0 #all of the swab channels that get used
+    usedChans = [chan for chan in range(NUM_DIG_CHANS) if (usedMask >> chan) & 1]
+    if not usedChans:
+        return({})
+    durs = durs.tolist()
+    chanVals = _expandMasks(masks, np.array(usedChans, dtype=np.uint32)).tolist()
+    return( {chan: list(zip(durs, vals)) for chan, vals in zip(usedChans, chanVals)} )
+
+
+def _channelPatterns(RLEseq, withAnalog=False):
+    '''Builds {chan: [(dur, 1 if chan is on in step else 0), ...]} for every digital channel used in an RLE sequence.
+    Each step's channels are turned into a bitmask once, so whether a channel is on is just a shift and an AND over all of the steps at once
+    Arguments:  *RLEseq, sequence of the form [ (Duration in ns, [Dig Chans to Turn On] or chanMask, A0, A1), ...], or a SeqArr
+                *withAnalog (default False), also build the [(dur, A0), ...] and [(dur, A1), ...] patterns
+    Returns chanPulsePatterns, or (chanPulsePatterns, a0Pattern, a1Pattern) if withAnalog'''
+    if withAnalog:
+        seqArr = RLEseq if isinstance(RLEseq, SeqArr) else SeqArr.fromRLE(RLEseq)
+        durs = seqArr.durs.tolist()
+        return(_digPatterns(seqArr.durs, seqArr.masks), list(zip(durs, seqArr.a0.tolist())), list(zip(durs, seqArr.a1.tolist())))
+
+    if isinstance(RLEseq, SeqArr): #already in array form
+        return(_digPatterns(RLEseq.durs, RLEseq.masks))
+    RLEseq = RLEseq if isinstance(RLEseq, (list, tuple)) else list(RLEseq)
+    numSteps = len(RLEseq)
+    durs = np.fromiter((step[0] for step in RLEseq), dtype=np.int64, count=numSteps)
+    masks = np.fromiter((chanMask(step[1]) for step in RLEseq), dtype=np.uint32, count=numSteps) #digital only, steps may not have analog values
+    return(_digPatterns(durs, masks))
+
+
 def convertDigRLEtoSeq(RLEseq):
     '''Converts sequences of the form [ (Duration in ns, [Dig Chans to Turn On], A0, A1), (Dur in ns, [Dig Chans On], A0, A1), ...]
-    type sequences to Swabian Sequences (mostly to aid with plotting). IGNORES ANALOG OUTPUTS'''
-    RLEusedChans = set( [] )
-    for step in RLEseq:
-        RLEusedChans |= set(step[1]) #make a set with all of the swab channels that get used
-
+    type sequences to Swabian Sequences (mostly to aid with plotting). IGNORES ANALOG OUTPUTS
+    RLEseq can be any iterable of steps (e.g. a Pulses.iter* generator) or a SeqArr'''
     swabSeq = Sequence()
-    for chan in RLEusedChans:
-        chanPulsePattern = [ (step[0], int(chan in step[1]) ) for step in RLEseq] #loop over steps, have (dur, 1) if chan is on in step, else (dur 0)
+    for chan, chanPulsePattern in _channelPatterns(RLEseq).items():
         swabSeq.setDigital(chan, chanPulsePattern)
 
     return(swabSeq)
@@ -28,28 +144,96 @@ def convertDigRLEtoSeq(RLEseq):
 
 def convertRLEtoSeq(RLEseq):
     '''Converts sequences of the form [ (Duration in ns, [Dig Chans to Turn On], A0, A1), (Dur in ns, [Dig Chans On], A0, A1), ...]
-    type sequences to Swabian Sequences (mostly to aid with plotting)'''
-    RLEusedChans = set( [] )
-    for step in RLEseq:
-        RLEusedChans |= set(step[1]) #make a set with all of the swab channels that get used
+    type sequences to Swabian Sequences (mostly to aid with plotting)
+    RLEseq can be any iterable of steps (e.g. a Pulses.iter* generator) or a SeqArr'''
+    chanPulsePatterns, a0Pattern, a1Pattern = _channelPatterns(RLEseq, withAnalog=True)
 
     swabSeq = Sequence()
-    for chan in RLEusedChans:
-        chanPulsePattern = [ (step[0], int(chan in step[1]) ) for step in RLEseq] #loop over steps, have (dur, 1) if chan is on in step, else (dur 0)
+    for chan, chanPulsePattern in chanPulsePatterns.items():
         swabSeq.setDigital(chan, chanPulsePattern)
-    swabSeq.setAnalog(0, [(step[0], step[2]) for step in RLEseq]) 
-    swabSeq.setAnalog(1, [(step[0], step[3]) for step in RLEseq]) 
+    swabSeq.setAnalog(0, a0Pattern) 
+    swabSeq.setAnalog(1, a1Pattern) 
 
     return(swabSeq)
 
 
+def coalesceRLE(RLEseq):
+    '''Merges consecutive steps of an RLE sequence [ (Duration in ns, [Dig Chans to Turn On], A0, A1), ...] that have the same
+    channels on and the same analog voltages by summing their durations, and drops zero duration steps.
+    The output plays back identically, but has fewer steps for the Swabian to take in'''
+    coalesced = []
+    prevState = None
+    for step in RLEseq:
+        if step[0] == 0:
+            continue
+        state = (frozenset(step[1]), step[2], step[3]) #frozenset so channel order doesn't matter
+        if state == prevState:
+            prevStep = coalesced[-1]
+            coalesced[-1] = (prevStep[0]+step[0], prevStep[1], prevStep[2], prevStep[3])
+        else:
+            coalesced.append(step)
+            prevState = state
+    return(coalesced)
+
+
 def convertSecArgsToNanosec(*args):
-    '''Converts a handful of args in seconds to an appropriate number of integer nanoseconds to be Swabian-compatible'''
-    return [int(val*1e9) for val in args]
+    '''Converts a handful of args in seconds to an appropriate number of integer nanoseconds to be Swabian-compatible
+    (rounded to the nearest ns, since e.g. int(30e-9*1e9) truncates to 29)'''
+    return np.rint(np.asarray(args, dtype=np.float64) * 1e9).astype(np.int64).tolist()
 
 def convertSecKwargsToNanosec(**kwargs):
-    '''Converts a handful of kwargs in seconds to an appropriate number of integer nanoseconds to be Swabian-compatible'''
-    return dict([key, int(val*1e9)] for key,val in kwargs.items())
+    '''Converts a handful of kwargs in seconds to an appropriate number of integer nanoseconds to be Swabian-compatible
+    (rounded to the nearest ns, same as convertSecArgsToNanosec)'''
+    nanosecs = np.rint(np.asarray(list(kwargs.values()), dtype=np.float64) * 1e9).astype(np.int64)
+    return dict(zip(kwargs.keys(), nanosecs.tolist()))
+
+
+_EMPTY_CHANS = () #shared channel set of every step with all digital channels off
+
+
+#cached building blocks, shared (immutable) by every sequence in a sweep that uses the same times. Extend a list with them
+@lru_cache(maxsize=1024)
+def _rawMwPulse(mwTime:int, rfSwitch):
+    '''Cached version of Pulses.rawMwPulse as a tuple of steps'''
+    return( ((mwTime, (rfSwitch,), 0,0),) )
+
+@lru_cache(maxsize=1024)
+def _rawLaserPulse(laserTime:int, aomV):
+    '''Cached version of Pulses.rawLaserPulse as a tuple of steps'''
+    return( ((laserTime, _EMPTY_CHANS, aomV,0),) )
+
+@lru_cache(maxsize=1024)
+def _wait(delayTime:int):
+    '''Cached version of Pulses.wait as a tuple of steps'''
+    return( ((delayTime, _EMPTY_CHANS, 0,0),) )
+
+@lru_cache(maxsize=16)
+def _clkPulses(clkPulseDur:int):
+    '''Cached ((clkPulseDur, 1), (clkPulseDur, 0)) high/low digital pattern entries for a clock pulse'''
+    return( ((clkPulseDur, 1), (clkPulseDur, 0)) )
+
+@lru_cache(maxsize=256)
+def _rawReadoutAndInitPulse(readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, aomV, clkPulseDur:int, clkChan):
+    '''Cached version of Pulses.rawReadoutAndInitPulse as a tuple of steps'''
+    if readOutTime <= clkPulseDur:
+        raise(ValueError(f'Specified Readout Time {readOutTime} is less than the {clkPulseDur}ns length of a CLK pulse'))
+    readOutWindow = ((clkPulseDur, (clkChan,), aomV,0),
+                     (readOutTime-clkPulseDur, _EMPTY_CHANS, aomV,0),
+                     (clkPulseDur, (clkChan,), aomV,0))
+    return( readOutWindow + _rawLaserPulse(extraInitLaserTime, aomV) + _wait(aomFallLagAndISC) )
+
+@lru_cache(maxsize=64)
+def _readoutAndInitPulse(aomRiseLag:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, aomV, flag:bool, clkPulseDur:int, clkChan, trigChan):
+    '''Cached version of Pulses.readoutAndInitPulse as a tuple of steps. Every point of a sweep starts with the same (flag and no-flag)
+    readout+init, so it only gets built once per set of timings'''
+    if flag:
+        if aomRiseLag <= clkPulseDur:
+            raise(ValueError(f'Specified AOM Rise {aomRiseLag}ns is less than the {clkPulseDur}ns length of a CLK pulse. Cant send FLAG pulse during AOM buffer'))
+        aomLagCompensation = ((clkPulseDur, (trigChan,), aomV,0),) + _rawLaserPulse(aomRiseLag-clkPulseDur, aomV)
+    else:
+        aomLagCompensation = _rawLaserPulse(aomRiseLag, aomV)
+    #the readout window and init are the same (cached) steps as _rawReadoutAndInitPulse, only the rise lag/flag prefix is added
+    return( aomLagCompensation + _rawReadoutAndInitPulse(readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, clkPulseDur, clkChan) )
 
 
 
@@ -65,35 +249,47 @@ class Pulses():
     DEFAULT_AOM_VOLTAGE = 0.9 #V
 
     #General sequence is of the form:
-    #[(duration in ns, [list of channels to turn on, others are off (empty is all off)], A0_Voltage, A1_Voltage), (duration2, [channel2], A0V_2, A1V_2), ...]
+    #[(duration in ns, (tuple of channels to turn on, others are off (empty is all off)), A0_Voltage, A1_Voltage), (duration2, (channel2,), A0V_2, A1V_2), ...]
+    #(builders emit tuples, but lists of channels work everywhere too)
     def __init__(self):
-        pass
+        #bind the channels once so the builders don't look them up in DIG_CHAN_DICT for every step
+        self._rf = self.DIG_CHAN_DICT['rfSwitch']
+        self._clk = self.DIG_CHAN_DICT['Clk']
+        self._trig = self.DIG_CHAN_DICT['Trig']
+
+
+    @staticmethod
+    def clearCaches():
+        '''Empties the cached building blocks (e.g. to free memory after a long run of sweeps). Cached blocks are keyed on the channels
+        and clock pulse length they were built with, so changing DIG_CHAN_DICT only needs a new Pulses(), not this'''
+        for cachedBlock in (_rawMwPulse, _rawLaserPulse, _wait, _clkPulses, _rawReadoutAndInitPulse, _readoutAndInitPulse):
+            cachedBlock.cache_clear()
 
 
     def rawMwPulse(self, mwTime:int):
         '''Returns a Swabian Seq-compatible list that will switch MWs on for mwTime
         Arguments:  *mwTime, time to turn MWs on for (in ns)'''
-        return( [(mwTime, [self.DIG_CHAN_DICT['rfSwitch']], 0,0)] )
+        return( list(_rawMwPulse(mwTime, self._rf)) )
 
 
     def rawLaserPulse(self, laserTime:int, aomV=DEFAULT_AOM_VOLTAGE):
         '''Returns a Swabian Seq-compatible list that will switch laser on for laserTime
         Arguments:  *laserTime, time to turn laser on for (in ns)
                     *aomV (default DEFAULT_AOM_VOLTAGE), voltage to turn AOM on with (in V)'''
-        return( [(laserTime, [], aomV,0)] )
+        return( list(_rawLaserPulse(laserTime, aomV)) )
 
 
     def wait(self, delayTime:int):
         '''Returns a Swabian Seq-compatible list with all channels off for delayTime
         Arguments:  *delayTime, time to do nothing (in ns)'''
-        return( [(delayTime, [], 0,0)] )
+        return( list(_wait(delayTime)) )
     
 
     def comboPulse(self, time:int, aomV=DEFAULT_AOM_VOLTAGE):
         '''Returns a Swabian Seq-compatible list that will switch laser and MWs on for mwTime (naively, ignores AOM lag)
         Arguments:  *mwTime, time to turn MWs on for (in ns)
                     *aomV (default DEFAULT_AOM_VOLTAGE), voltage to turn AOM on with (in V)'''
-        return( [(time, [self.DIG_CHAN_DICT['rfSwitch']], aomV,0)])
+        return( [(time, (self._rf,), aomV,0)])
     
 
     def rawReadOutPulse(self, readOutTime:int, aomV=DEFAULT_AOM_VOLTAGE):
@@ -103,9 +299,9 @@ class Pulses():
         if readOutTime <= self.DEFAULT_CLK_PULSE_DUR:
             raise(ValueError(f'Specified Readout Time {readOutTime} is less than the {self.DEFAULT_CLK_PULSE_DUR}ns length of a CLK pulse'))
         
-        return( [(self.DEFAULT_CLK_PULSE_DUR, [self.DIG_CHAN_DICT['Clk']], aomV,0),
-                 (readOutTime-self.DEFAULT_CLK_PULSE_DUR, [], aomV,0),
-                 (self.DEFAULT_CLK_PULSE_DUR, [self.DIG_CHAN_DICT['Clk']], aomV,0)] )
+        return( [(self.DEFAULT_CLK_PULSE_DUR, (self._clk,), aomV,0),
+                 (readOutTime-self.DEFAULT_CLK_PULSE_DUR, _EMPTY_CHANS, aomV,0),
+                 (self.DEFAULT_CLK_PULSE_DUR, (self._clk,), aomV,0)] )
 
 
     def rawReadoutAndInitPulse(self, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, aomV=DEFAULT_AOM_VOLTAGE):
@@ -117,10 +313,7 @@ class Pulses():
                     *aomFallLagAndISC, time to wait for AOM to fall and for ISC to depopulate (in ns)
                     *aomV (default DEFAULT_AOM_VOLTAGE), voltage to turn AOM on with (in V)'''
 
-        readOutWindow = self.rawReadOutPulse(readOutTime, aomV)
-        extraLaserForInit = self.rawLaserPulse(extraInitLaserTime, aomV)
-        aomLagAndIscDelay = self.wait(aomFallLagAndISC)
-        return(readOutWindow + extraLaserForInit + aomLagAndIscDelay)
+        return( list(_rawReadoutAndInitPulse(readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, self.DEFAULT_CLK_PULSE_DUR, self._clk)) )
     
     
     def readoutAndInitPulse(self, aomRiseLag:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, aomV=DEFAULT_AOM_VOLTAGE, flag=False):
@@ -132,15 +325,13 @@ class Pulses():
                     *aomFallLagAndISC, time to wait for AOM to fall and for ISC to depopulate (in ns)
                     *aomV (default DEFAULT_AOM_VOLTAGE), voltage to turn AOM on with (in V)
                     *flag (default False): whether to turn on the flag channel for the length of a Clk pulse when the AOM buffering starts'''
-        if flag:
-            if aomRiseLag <= self.DEFAULT_CLK_PULSE_DUR:
-                raise(ValueError(f'Specified AOM Rise {aomRiseLag}ns is less than the {self.DEFAULT_CLK_PULSE_DUR}ns length of a CLK pulse. Cant send FLAG pulse during AOM buffer'))
-            aomLagCompensation = [(self.DEFAULT_CLK_PULSE_DUR, [self.DIG_CHAN_DICT['Trig']], aomV,0)] + self.rawLaserPulse(aomRiseLag-self.DEFAULT_CLK_PULSE_DUR, aomV)
-        else:
-            aomLagCompensation = self.rawLaserPulse(aomRiseLag, aomV)
+        return( list(self._readoutAndInitSteps(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag)) )
 
-        rawReadoutAndInitPulse = self.rawReadoutAndInitPulse(readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV)
-        return(aomLagCompensation + rawReadoutAndInitPulse)
+
+    def _readoutAndInitSteps(self, aomRiseLag:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, aomV=DEFAULT_AOM_VOLTAGE, flag=False):
+        '''Same as readoutAndInitPulse, but returns the cached (immutable) tuple of steps for building sequences with extend'''
+        return( _readoutAndInitPulse(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, bool(flag),
+                                     self.DEFAULT_CLK_PULSE_DUR, self._clk, self._trig) )
 
 
     def readOutWithMWs(self, preReadoutLaserAndMwTime:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, aomV=DEFAULT_AOM_VOLTAGE, flag=False):
@@ -155,19 +346,21 @@ class Pulses():
         if readOutTime <= self.DEFAULT_CLK_PULSE_DUR:
             raise(ValueError(f'Specified Readout Time {readOutTime} is less than the {self.DEFAULT_CLK_PULSE_DUR}ns length of a CLK pulse'))
         
+        rf, clk = self._rf, self._clk
         if flag:
             if preReadoutLaserAndMwTime <= self.DEFAULT_CLK_PULSE_DUR:
                 raise(ValueError(f'Specified preRO Laser+MW time {preReadoutLaserAndMwTime}ns is less than the {self.DEFAULT_CLK_PULSE_DUR}ns length of a CLK pulse. Cant send FLAG pulse during AOM buffer'))
-            preReadoutLaserAndMws = [(self.DEFAULT_CLK_PULSE_DUR, [self.DIG_CHAN_DICT['Trig'], self.DIG_CHAN_DICT['rfSwitch']], aomV,0)] + [(preReadoutLaserAndMwTime-self.DEFAULT_CLK_PULSE_DUR, [self.DIG_CHAN_DICT['rfSwitch']], aomV,0)]
+            seq = [(self.DEFAULT_CLK_PULSE_DUR, (self._trig, rf), aomV,0),
+                   (preReadoutLaserAndMwTime-self.DEFAULT_CLK_PULSE_DUR, (rf,), aomV,0)] #pre-readout laser+MWs
         else:
-            preReadoutLaserAndMws = [(preReadoutLaserAndMwTime, [self.DIG_CHAN_DICT['rfSwitch']], aomV,0)]
+            seq = [(preReadoutLaserAndMwTime, (rf,), aomV,0)]
         
-        readOutWindow = [(self.DEFAULT_CLK_PULSE_DUR, [self.DIG_CHAN_DICT['rfSwitch'],self.DIG_CHAN_DICT['Clk']], aomV,0),
-                         (readOutTime-self.DEFAULT_CLK_PULSE_DUR, [self.DIG_CHAN_DICT['rfSwitch']], aomV,0),
-                         (self.DEFAULT_CLK_PULSE_DUR, [self.DIG_CHAN_DICT['rfSwitch'],self.DIG_CHAN_DICT['Clk']], aomV,0)]
-        extraLaserForInit = self.rawLaserPulse(extraInitLaserTime, aomV)
-        aomLagAndIscDelay = self.wait(aomFallLagAndISC)
-        return(preReadoutLaserAndMws + readOutWindow + extraLaserForInit + aomLagAndIscDelay)
+        seq.extend( ((self.DEFAULT_CLK_PULSE_DUR, (rf,clk), aomV,0), #readout window
+                     (readOutTime-self.DEFAULT_CLK_PULSE_DUR, (rf,), aomV,0),
+                     (self.DEFAULT_CLK_PULSE_DUR, (rf,clk), aomV,0)) )
+        seq.extend(_rawLaserPulse(extraInitLaserTime, aomV)) #extra laser for init
+        seq.extend(_wait(aomFallLagAndISC)) #AOM lag and ISC delay
+        return(seq)
 
 
     #now for the actual measurement sequences
@@ -181,9 +374,9 @@ class Pulses():
                     *extraInitLaserTime, time to have only laser on to reset NV state (in ns)
                     *aomFallLagAndISC, time to wait for AOM to fall and for ISC to depopulate (extra delay can be added here) (in ns)
                     *aomV (default DEFAULT_AOM_VOLTAGE), voltage to turn AOM on with (in V)'''
-        withMwsSeq = self.readOutWithMWs(preReadoutLaserAndMwTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True)
-        withoutMwsSeq = self.readoutAndInitPulse(preReadoutLaserAndMwTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV)
-        return(withMwsSeq + withoutMwsSeq)
+        seq = self.readOutWithMWs(preReadoutLaserAndMwTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True)
+        seq.extend(self._readoutAndInitSteps(preReadoutLaserAndMwTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV))
+        return(coalesceRLE(seq))
     
 
     #old 'inefficient' pulse sequences that take background everywhere
@@ -200,12 +393,51 @@ class Pulses():
                     *bufferTime, time to wait between MW pulse and start of (AOM buffering for) readout. Default is 0
                     *aomV (default DEFAULT_AOM_VOLTAGE), voltage to turn AOM on with (in V)
         '''
-        mwSeq = self.readoutAndInitPulse(aomRiseLagTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True ) + self.wait(maxTauTime-tauTime) + self.rawMwPulse(tauTime)
-        noMwSeq = self.readoutAndInitPulse(aomRiseLagTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV ) + self.wait(maxTauTime-tauTime) + self.wait(tauTime)
+        return(coalesceRLE(self.iterRabiWithBackground(tauTime, maxTauTime, aomRiseLagTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, bufferTime, aomV)))
+
+
+    def iterRabiWithBackground(self, tauTime:int, maxTauTime:int, aomRiseLagTime:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, bufferTime:int=0, aomV=DEFAULT_AOM_VOLTAGE):
+        '''Generator version of rabiWithBackground (same arguments), lazily yields its steps (without coalescing) for consumers that only iterate'''
+        rf = self._rf
+        yield from self._readoutAndInitSteps(aomRiseLagTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True )
+        yield from _wait(maxTauTime-tauTime)
+        yield from _rawMwPulse(tauTime, rf) #MW pulse
         if bufferTime != 0:
-            return(mwSeq + self.wait(bufferTime) + noMwSeq + self.wait(bufferTime))
-        else:
-            return(mwSeq + noMwSeq)
+            yield from _wait(bufferTime)
+        yield from self._readoutAndInitSteps(aomRiseLagTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV )
+        yield from _wait(maxTauTime-tauTime)
+        yield from _wait(tauTime) #no MW pulse
+        if bufferTime != 0:
+            yield from _wait(bufferTime)
+
+
+    def buildRabiTemplate(self, maxTauTime:int, aomRiseLagTime:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, bufferTime:int=0, aomV=DEFAULT_AOM_VOLTAGE):
+        '''Builds the parts of rabiWithBackground that don't depend on tauTime once for a whole sweep, so rabiFromTemplate
+        only has to patch in the 2 steps that do. Same arguments as rabiWithBackground, minus tauTime
+        Returns (steps, (waitIndex, mwIndex), maxTauTime), where steps[waitIndex] and steps[mwIndex] are placeholders
+        for the wait(maxTauTime-tauTime) and MW pulse. The no-MW half always waits maxTauTime in total, so it's fixed'''
+        steps = coalesceRLE(self._readoutAndInitSteps(aomRiseLagTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True ))
+        varIndices = (len(steps), len(steps)+1)
+        steps.extend(_wait(maxTauTime))
+        steps.extend(_rawMwPulse(0, self._rf))
+
+        noMwSeq = list(_wait(bufferTime))
+        noMwSeq.extend(self._readoutAndInitSteps(aomRiseLagTime, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV ))
+        noMwSeq.extend(_wait(maxTauTime)) #maxTauTime-tauTime, then tauTime without MWs
+        noMwSeq.extend(_wait(bufferTime))
+        steps.extend(coalesceRLE(noMwSeq))
+        return(steps, varIndices, maxTauTime)
+
+
+    def rabiFromTemplate(self, template, tauTime:int):
+        '''Returns the rabiWithBackground sequence for tauTime from a buildRabiTemplate template (same timing, possibly split into more steps)
+        Arguments:  *template, output of buildRabiTemplate
+                    *tauTime, time to apply MWs for this Rabi experiment'''
+        steps, (waitIndex, mwIndex), maxTauTime = template
+        seq = steps.copy()
+        seq[waitIndex] = _wait(maxTauTime-tauTime)[0]
+        seq[mwIndex] = _rawMwPulse(tauTime, self._rf)[0]
+        return(seq)
         
 
     def pODMRwithBackground(self, piPulseTime:int, aomRiseLagTime:int, readOutTime:int, initTime:int, aomFallLagAndISC:int, bufferTime:int=0, aomV=DEFAULT_AOM_VOLTAGE):
@@ -218,9 +450,17 @@ class Pulses():
                     *bufferTime=0, time(ns) after pi pulse before (AOM start buffering for) readout
                     *aomV (default DEFAULT_AOM_VOLTAGE), voltage to turn AOM on with (in V)
         '''
-        seqWithMws = self.readoutAndInitPulse(aomRiseLagTime, readOutTime, initTime,  aomFallLagAndISC, aomV, flag=True) + self.rawMwPulse(piPulseTime) + self.wait(bufferTime) 
-        seqNoMWs =  self.readoutAndInitPulse(aomRiseLagTime, readOutTime, initTime,  aomFallLagAndISC, aomV) + self.wait(piPulseTime) + self.wait(bufferTime)
-        return(seqWithMws + seqNoMWs)
+        return(coalesceRLE(self.iterPODMRwithBackground(piPulseTime, aomRiseLagTime, readOutTime, initTime, aomFallLagAndISC, bufferTime, aomV)))
+
+
+    def iterPODMRwithBackground(self, piPulseTime:int, aomRiseLagTime:int, readOutTime:int, initTime:int, aomFallLagAndISC:int, bufferTime:int=0, aomV=DEFAULT_AOM_VOLTAGE):
+        '''Generator version of pODMRwithBackground (same arguments), lazily yields its steps (without coalescing) for consumers that only iterate'''
+        yield from self._readoutAndInitSteps(aomRiseLagTime, readOutTime, initTime,  aomFallLagAndISC, aomV, flag=True)
+        yield from _rawMwPulse(piPulseTime, self._rf)
+        yield from _wait(bufferTime)
+        yield from self._readoutAndInitSteps(aomRiseLagTime, readOutTime, initTime,  aomFallLagAndISC, aomV)
+        yield from _wait(piPulseTime)
+        yield from _wait(bufferTime)
     
 
     def tripleRamsey(self, halfPiTime:int, threeHalfPiTime:int, tauTime:int, maxTauTime:int, aomRiseLag:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, bufferTime:int=0, aomV=DEFAULT_AOM_VOLTAGE):
@@ -238,10 +478,18 @@ class Pulses():
                     *bufferTime, time to wait between MW pulse and start of (AOM buffering for) readout. Default is 0
                     *aomV (default DEFAULT_AOM_VOLTAGE), voltage to turn AOM on with (in V)
         '''
-        pi2pi2Seq = self.readoutAndInitPulse(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True) + self.wait(maxTauTime-tauTime) + self.rawMwPulse(halfPiTime)+ self.wait(tauTime) + self.rawMwPulse(halfPiTime)
-        pi2pi32Seq = self.readoutAndInitPulse(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV) + self.wait(maxTauTime-tauTime) + self.rawMwPulse(halfPiTime)+ self.wait(tauTime) + self.rawMwPulse(threeHalfPiTime)
-        noMwSeq = self.readoutAndInitPulse(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV) + self.wait(maxTauTime-tauTime) + self.wait(halfPiTime) + self.wait(tauTime) + self.wait(halfPiTime)
-        return(pi2pi2Seq + self.wait(bufferTime) + pi2pi32Seq + self.wait(bufferTime) + noMwSeq + self.wait(bufferTime))
+        return(coalesceRLE(self.iterTripleRamsey(halfPiTime, threeHalfPiTime, tauTime, maxTauTime, aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, bufferTime, aomV)))
+
+
+    def iterTripleRamsey(self, halfPiTime:int, threeHalfPiTime:int, tauTime:int, maxTauTime:int, aomRiseLag:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, bufferTime:int=0, aomV=DEFAULT_AOM_VOLTAGE):
+        '''Generator version of tripleRamsey (same arguments), lazily yields its steps (without coalescing) for consumers that only iterate'''
+        rf = self._rf
+        yield from self._readoutAndInitSteps(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True) #pi/2-pi/2
+        yield from chain(_wait(maxTauTime-tauTime), _rawMwPulse(halfPiTime, rf), _wait(tauTime), _rawMwPulse(halfPiTime, rf), _wait(bufferTime))
+        yield from self._readoutAndInitSteps(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV) #pi/2-3pi/2
+        yield from chain(_wait(maxTauTime-tauTime), _rawMwPulse(halfPiTime, rf), _wait(tauTime), _rawMwPulse(threeHalfPiTime, rf), _wait(bufferTime))
+        yield from self._readoutAndInitSteps(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV) #no MWs
+        yield from chain(_wait(maxTauTime-tauTime), _wait(halfPiTime), _wait(tauTime), _wait(halfPiTime), _wait(bufferTime))
     
 
     def balancedDiffT2Hahn(self, halfPiPulseTime:int, piPulseTime:int, threeHalvesPiPulseTime:int, shortTauTimeOverTwo:int, longTauTimeOverTwo:int, aomRiseLag:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, bufferTime:int=0, aomV:float=DEFAULT_AOM_VOLTAGE):
@@ -259,12 +507,20 @@ class Pulses():
                     *bufferTime, time to wait between MW pulse and start of (AOM buffering for) readout. Default is 0
                     *aomV (default DEFAULT_AOM_VOLTAGE), voltage to turn AOM on with (in V)
         '''
-        shortTwoHalfPulseSeq = self.readoutAndInitPulse(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True) + self.rawMwPulse(halfPiPulseTime) + self.wait(shortTauTimeOverTwo) + self.rawMwPulse(piPulseTime) + self.wait(shortTauTimeOverTwo) + self.rawMwPulse(halfPiPulseTime)
-        longHalfThreeHalfPulseSeq = self.readoutAndInitPulse(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV) + self.rawMwPulse(halfPiPulseTime) + self.wait(longTauTimeOverTwo) + self.rawMwPulse(piPulseTime) + self.wait(longTauTimeOverTwo) + self.rawMwPulse(threeHalvesPiPulseTime)
+        return(coalesceRLE(self.iterBalancedDiffT2Hahn(halfPiPulseTime, piPulseTime, threeHalvesPiPulseTime, shortTauTimeOverTwo, longTauTimeOverTwo, aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, bufferTime, aomV)))
+
+
+    def iterBalancedDiffT2Hahn(self, halfPiPulseTime:int, piPulseTime:int, threeHalvesPiPulseTime:int, shortTauTimeOverTwo:int, longTauTimeOverTwo:int, aomRiseLag:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, bufferTime:int=0, aomV:float=DEFAULT_AOM_VOLTAGE):
+        '''Generator version of balancedDiffT2Hahn (same arguments), lazily yields its steps (without coalescing) for consumers that only iterate'''
+        rf = self._rf
+        yield from self._readoutAndInitSteps(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True) #short pi/2-pi-pi/2
+        yield from chain(_rawMwPulse(halfPiPulseTime, rf), _wait(shortTauTimeOverTwo), _rawMwPulse(piPulseTime, rf), _wait(shortTauTimeOverTwo), _rawMwPulse(halfPiPulseTime, rf))
         if bufferTime != 0:
-            return(shortTwoHalfPulseSeq + self.wait(bufferTime) + longHalfThreeHalfPulseSeq +self.wait(bufferTime) )
-        else:
-            return(shortTwoHalfPulseSeq + longHalfThreeHalfPulseSeq )
+            yield from _wait(bufferTime)
+        yield from self._readoutAndInitSteps(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV) #long pi/2-pi-3pi/2
+        yield from chain(_rawMwPulse(halfPiPulseTime, rf), _wait(longTauTimeOverTwo), _rawMwPulse(piPulseTime, rf), _wait(longTauTimeOverTwo), _rawMwPulse(threeHalvesPiPulseTime, rf))
+        if bufferTime != 0:
+            yield from _wait(bufferTime)
         
     
     def balancedDiffT1(self, piPulseTime:int, shortTauTime:int, longTauTime:int, aomRiseLag:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, bufferTime:int=0, aomV:float=DEFAULT_AOM_VOLTAGE):
@@ -280,12 +536,18 @@ class Pulses():
                     *bufferTime, time to wait between MW pulse and start of (AOM buffering for) readout. Default is 0
                     *aomV (default DEFAULT_AOM_VOLTAGE), voltage to turn AOM on with (in V)
         '''
-        noPulseSeq = self.readoutAndInitPulse(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True) + self.wait(shortTauTime)
-        piPulseSeq = self.readoutAndInitPulse(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV) + self.wait(longTauTime) + self.rawMwPulse(piPulseTime)
+        return(coalesceRLE(self.iterBalancedDiffT1(piPulseTime, shortTauTime, longTauTime, aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, bufferTime, aomV)))
+
+
+    def iterBalancedDiffT1(self, piPulseTime:int, shortTauTime:int, longTauTime:int, aomRiseLag:int, readOutTime:int, extraInitLaserTime:int, aomFallLagAndISC:int, bufferTime:int=0, aomV:float=DEFAULT_AOM_VOLTAGE):
+        '''Generator version of balancedDiffT1 (same arguments), lazily yields its steps (without coalescing) for consumers that only iterate'''
+        yield from self._readoutAndInitSteps(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV, flag=True) #no pulse
+        yield from _wait(shortTauTime)
+        yield from self._readoutAndInitSteps(aomRiseLag, readOutTime, extraInitLaserTime, aomFallLagAndISC, aomV) #pi pulse
+        yield from _wait(longTauTime)
+        yield from _rawMwPulse(piPulseTime, self._rf)
         if bufferTime != 0:
-            return(noPulseSeq + piPulseSeq + self.wait(bufferTime))
-        else:
-            return(noPulseSeq + piPulseSeq)
+            yield from _wait(bufferTime)
     
 
 
@@ -305,11 +567,13 @@ class Pulses():
             raise(ValueError(f'Count Duration {countDur}ns is less than Length of 2 {clkPulseDur}ns Clock Pulses'))
         if ifFlag and countStartTime <= 2*clkPulseDur:
             raise(ValueError(f'Count Start Time {countStartTime}ns is less than Length of 2 {clkPulseDur}ns Clock Pulses'))
+        clkHi, clkLo = _clkPulses(clkPulseDur)
+        twoClkPulsesDur = 2*clkPulseDur
         seq = Sequence() 
         seq.setAnalog(0, [(laserStartTime, 0), (laserDur, aomV), (fullLengthWithBuffer-(laserStartTime+laserDur), 0)] ) #switch the laser on only for the laserDur
-        seq.setDigital(self.DIG_CHAN_DICT['Clk'], [(countStartTime, 0), (clkPulseDur, 1), (countDur-clkPulseDur, 0),  (clkPulseDur, 1), (clkPulseDur, 0), (fullLengthWithBuffer-(countStartTime+countDur+2*clkPulseDur), 0)] )
+        seq.setDigital(self._clk, [(countStartTime, 0), clkHi, (countDur-clkPulseDur, 0), clkHi, clkLo, (fullLengthWithBuffer-(countStartTime+countDur+twoClkPulsesDur), 0)] )
         if ifFlag:
-            seq.setDigital(self.DIG_CHAN_DICT['Trig'], [(clkPulseDur, 1), (clkPulseDur, 0), (fullLengthWithBuffer-2*clkPulseDur, 0)] )
+            seq.setDigital(self._trig, [clkHi, clkLo, (fullLengthWithBuffer-twoClkPulsesDur, 0)] )
         return(seq, seq.getDuration())#.getData())
 
     #Pausing these for now until I figure out what to do about flagging
@@ -373,7 +637,7 @@ class Pulses():
         '''
         
         twoHalfPulsesSeq = Sequence() #easier to do things with swab seqs
-        twoHalfPulsesSeq.setDigital(self.DIG_CHAN_DICT['rfSwitch'], [(halfPiPulseTime, 1), (tau, 0), (halfPiPulseTime, 1), (1, 0)]) #apply MW pulses, padding with 1ns of 0, otherwise extending this seq keeps MWs on
+        twoHalfPulsesSeq.setDigital(self._rf, [(halfPiPulseTime, 1), (tau, 0), (halfPiPulseTime, 1), (1, 0)]) #apply MW pulses, padding with 1ns of 0, otherwise extending this seq keeps MWs on
         if aomRiseTime-secondPulseToRObuffer <= twoHalfPulsesSeq.getDuration(): #if that pulse seq takes longer than the AOM buffer, just start buffering the AOM in the middle
             twoHalfPulsesSeq.setDigital(self.DIG_CHAN_DICT['aomSwitch'], [(twoHalfPulsesSeq.getDuration()-(aomRiseTime-secondPulseToRObuffer), 0), ((aomRiseTime-secondPulseToRObuffer), 1)])
         else: #if the AOM needs more buffer than the length of the seq, then turn the laser on for a bit beforehand and then for the whole MW pulse seq
@@ -382,7 +646,22 @@ class Pulses():
 
         pass
     """
-    """def diffRamsey(self, readOutTime, initTime, aomRiseTime, aomFallLagTime, iscWaitTime, tau, maxTau, halfPiPulseTime, threeHalvesPiPulseTime, secondPulseToRObuffer=0):
+    """def _prebufferAom(self, mwSeq, aomLead):
+        '''Switches the AOM on for the last aomLead of a Swabian Seq of MW pulses, so the laser is already on when the R/O window starts.
+        If aomLead is longer than the Seq, the AOM is on for the whole Seq and an AOM-only step is prepended to make up the difference
+        Arguments:  *mwSeq, Swabian Seq of MW pulses (modified in place)
+                    *aomLead, time(ns) the AOM needs to be on before the end of mwSeq
+        Returns (buffered Seq, its duration)'''
+        mwDur = mwSeq.getDuration()
+        aomChan = self.DIG_CHAN_DICT['aomSwitch']
+        if aomLead <= mwDur: #if that pulse seq takes longer than the AOM buffer, just start buffering the AOM in the middle
+            mwSeq.setDigital(aomChan, [(mwDur-aomLead, 0), (aomLead, 1)])
+            return(mwSeq, mwDur)
+        #if the AOM needs more buffer than the length of the seq, then turn the laser on for a bit beforehand and then for the whole MW pulse seq
+        mwSeq.setDigital(aomChan, [(mwDur, 1)])
+        return(convertDigRLEtoSeq( [ [aomLead-mwDur, [aomChan]], ] ) + mwSeq, aomLead)
+
+    def diffRamsey(self, readOutTime, initTime, aomRiseTime, aomFallLagTime, iscWaitTime, tau, maxTau, halfPiPulseTime, threeHalvesPiPulseTime, secondPulseToRObuffer=0):
         '''Returns a Swabian compatible sequence for a differential Ramsey measurement 
         Built to R/O right after 2nd MW pulse, so the AOM will be pre-cooked to turn on right (or after a short buffer time) after 2nd MW pulse ends
         Also, will buffer duty cycle with init laser (should be fine... right) #TODO: Make sure this is right
@@ -397,28 +676,21 @@ class Pulses():
                     *secondPulseToRObuffer, time(ns) of a buffer between the 2nd MW pulse and the start of the R/O window
         '''
         
+        rfChan = self._rf
+        aomLead = aomRiseTime-secondPulseToRObuffer #how long the AOM has to be on before the end of the 2nd MW pulse
+
         twoHalfPulsesSeq = Sequence() #easier to do things with swab seqs
-        twoHalfPulsesSeq.setDigital(self.DIG_CHAN_DICT['rfSwitch'], [(halfPiPulseTime, 1), (tau, 0), (halfPiPulseTime, 1), (1, 0)]) #apply MW pulses, padding with 1ns of 0, otherwise extending this seq keeps MWs on
-        if aomRiseTime-secondPulseToRObuffer <= twoHalfPulsesSeq.getDuration(): #if that pulse seq takes longer than the AOM buffer, just start buffering the AOM in the middle
-            twoHalfPulsesSeq.setDigital(self.DIG_CHAN_DICT['aomSwitch'], [(twoHalfPulsesSeq.getDuration()-(aomRiseTime-secondPulseToRObuffer), 0), ((aomRiseTime-secondPulseToRObuffer), 1)])
-        else: #if the AOM needs more buffer than the length of the seq, then turn the laser on for a bit beforehand and then for the whole MW pulse seq
-            twoHalfPulsesSeq.setDigital(self.DIG_CHAN_DICT['aomSwitch'], [(twoHalfPulsesSeq.getDuration(),1)])
-            twoHalfPulsesSeq = convertDigRLEtoSeq( [ [(aomRiseTime-secondPulseToRObuffer)-twoHalfPulsesSeq.getDuration(), [self.DIG_CHAN_DICT['aomSwitch']]], ] ) + twoHalfPulsesSeq
+        twoHalfPulsesSeq.setDigital(rfChan, [(halfPiPulseTime, 1), (tau, 0), (halfPiPulseTime, 1), (1, 0)]) #apply MW pulses, padding with 1ns of 0, otherwise extending this seq keeps MWs on
+        twoHalfPulsesSeq, twoHalfDur = self._prebufferAom(twoHalfPulsesSeq, aomLead)
 
         halfThen3HalfPulsesSeq = Sequence() #now do the same thing with a 3pi/2 for the 2nd MW pulse
-        halfThen3HalfPulsesSeq.setDigital(self.DIG_CHAN_DICT['rfSwitch'], [(halfPiPulseTime, 1), (tau, 0), (threeHalvesPiPulseTime, 1), (1, 0)]) #apply MW pulses,  padding with 1ns of 0, otherwise extending this seq keeps MWs on
-        if aomRiseTime-secondPulseToRObuffer <= halfThen3HalfPulsesSeq.getDuration(): #if that pulse seq takes longer than the AOM buffer, just start buffering the AOM in the middle
-            halfThen3HalfPulsesSeq.setDigital(self.DIG_CHAN_DICT['aomSwitch'], [(halfThen3HalfPulsesSeq.getDuration()-(aomRiseTime-secondPulseToRObuffer), 0), ((aomRiseTime-secondPulseToRObuffer), 1)])
-        else: #if the AOM needs more buffer than the length of the seq, then turn the laser on for a bit beforehand and then for the whole MW pulse seq
-            halfThen3HalfPulsesSeq.setDigital(self.DIG_CHAN_DICT['aomSwitch'], [(halfThen3HalfPulsesSeq.getDuration(),1)])
-            halfThen3HalfPulsesSeq = convertDigRLEtoSeq( [ [(aomRiseTime-secondPulseToRObuffer)-halfThen3HalfPulsesSeq.getDuration(), [self.DIG_CHAN_DICT['aomSwitch']]], ] ) + halfThen3HalfPulsesSeq
+        halfThen3HalfPulsesSeq.setDigital(rfChan, [(halfPiPulseTime, 1), (tau, 0), (threeHalvesPiPulseTime, 1), (1, 0)]) #apply MW pulses,  padding with 1ns of 0, otherwise extending this seq keeps MWs on
+        halfThen3HalfPulsesSeq, halfThen3HalfDur = self._prebufferAom(halfThen3HalfPulsesSeq, aomLead)
         
         maxDcBalanceTime = max(aomRiseTime, maxTau+halfPiPulseTime+threeHalvesPiPulseTime)
-        roInto1ReinitAomFallAndIsc = self.rawReadoutAndInitPulse(readOutTime, initTime+(maxDcBalanceTime - twoHalfPulsesSeq.getDuration()), aomFallLagTime+iscWaitTime, countChan=1)
-        roInto2ReinitAomFallAndIsc = self.rawReadoutAndInitPulse(readOutTime, initTime+(maxDcBalanceTime - halfThen3HalfPulsesSeq.getDuration()), aomFallLagTime+iscWaitTime, countChan=2)
-
-        roInto1ReinitAomFallAndIsc = convertDigRLEtoSeq(roInto1ReinitAomFallAndIsc)
-        roInto2ReinitAomFallAndIsc = convertDigRLEtoSeq(roInto2ReinitAomFallAndIsc)
+        aomFallAndIsc = aomFallLagTime+iscWaitTime
+        roInto1ReinitAomFallAndIsc = convertDigRLEtoSeq(self.rawReadoutAndInitPulse(readOutTime, initTime+(maxDcBalanceTime - twoHalfDur), aomFallAndIsc, countChan=1))
+        roInto2ReinitAomFallAndIsc = convertDigRLEtoSeq(self.rawReadoutAndInitPulse(readOutTime, initTime+(maxDcBalanceTime - halfThen3HalfDur), aomFallAndIsc, countChan=2))
 
         if secondPulseToRObuffer:
             buffer = convertDigRLEtoSeq(self.wait(secondPulseToRObuffer))
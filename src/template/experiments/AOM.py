@@ -2,6 +2,7 @@
 #from os import wait
 import time
 import logging
+from functools import lru_cache
 from pathlib import Path
 
 import numpy as np
@@ -11,14 +12,38 @@ from nspyre import StreamingList
 from nspyre import nspyre_init_logger
 import matplotlib.pyplot as plt
 
-import pulsestreamer # you can download the packages using pip, see swabian 8/2 documentation
-from pulsestreamer import *
+from pulsestreamer import PulseStreamer, OutputState # you can download the packages using pip, see swabian 8/2 documentation
 
 from template.drivers.nspyre_drivers.ni.nidaqTimingFromSwab import TreelessNIDAQ
 from template.drivers.insmgr import MyInstrumentManager
 
 _HERE = Path(__file__).parent
 _logger = logging.getLogger(__name__)
+_LOGGER_READY = False # nspyre_init_logger has already been called in this process
+
+# plot labels pushed with every AOM_pulse dataset
+_AOM_PLOT = {
+    'title': 'Counts vs. Laser Exposure Time (ns)',
+    'xlabel': 'Pulse Duration (ns)',
+    'ylabel': 'Counts',
+}
+
+# one (duration in ns, level) entry of a PulseStreamer digital pattern
+_AOM_STEP = np.dtype([('dur', np.int64), ('lvl', np.int8)])
+
+@lru_cache(maxsize=32)
+def _aomPattern(t_i: float, t_f: float, num_pulses: int, off_ns: int):
+    """Returns the (duration, level) pattern that turns the AOM on for each of num_pulses times from t_i to t_f (ns),
+    followed by an off_ns pause after every pulse. Cached, since the same sweep settings get run over and over;
+    call _aomPattern.cache_clear() if how the AOM is driven changes.
+    """
+    patt = np.empty(2*num_pulses, dtype=_AOM_STEP)
+    patt['dur'][0::2] = np.rint(np.linspace(t_i, t_f, num_pulses))
+    patt['dur'][1::2] = off_ns
+    patt['lvl'][0::2] = 1
+    patt['lvl'][1::2] = 0
+    return tuple(patt.tolist()) # tolist on a structured array gives the (duration, level) tuples the Swabian takes
+
 
 class AOMPulse:
     """Spin measurement experiments."""
@@ -40,20 +65,24 @@ class AOMPulse:
         # if running a method from the GUI, it will be run in a new process
         # this logging call is necessary in order to separate log messages
         # originating in the GUI from those in the new experiment subprocess
-        nspyre_init_logger(
-            log_level=logging.INFO,
-            log_path=_HERE / '../logs',
-            log_path_level=logging.DEBUG,
-            prefix=Path(__file__).stem,
-            file_size=10_000_000,
-        )
+        # only done once per process, otherwise every instance adds another set of handlers
+        global _LOGGER_READY
+        if not _LOGGER_READY:
+            nspyre_init_logger(
+                log_level=logging.INFO,
+                log_path=_HERE / '../logs',
+                log_path_level=logging.DEBUG,
+                prefix=Path(__file__).stem,
+                file_size=10_000_000,
+            )
+            _LOGGER_READY = True
         _logger.info('Created SpinMeasurements instance.')
 
     def __exit__(self):
         """Perform experiment teardown."""
         _logger.info('Destroyed SpinMeasurements instance.')
 
-    def AOM_pulse(self, dataset: str, t_i: float, t_f: float, num_points: int, iterations: int):
+    def AOM_pulse(self, dataset: str, t_i: float, t_f: float, num_points: int, iterations: int, reset_on_entry: bool = False):
         
         """Args:
             dataset: name of the dataset to push data to
@@ -61,6 +90,7 @@ class AOMPulse:
             t_f (float): stop time (ns)
             num_points (int): number of points between start-stop (inclusive)
             iterations: number of times to repeat the experiment
+            reset_on_entry: reset the pulse streamer before streaming, e.g. if it didn't turn off after the last run
         """
         # connect to the instrument server
         # connect to the data server and create a data set, or connect to an
@@ -69,53 +99,78 @@ class AOMPulse:
         with MyInstrumentManager() as mgr, DataSource(dataset) as test_data:
             
             swab_driver = mgr.swabian # acsess modules in 'SwabianPS82.py' by using swab_driver.[whatever module want]
-            ps = pulsestreamer.PulseStreamer("169.254.8.2") # control the pulse streamer by using ps.[whatever module you want]
+            ps = PulseStreamer("169.254.8.2") # control the pulse streamer by using ps.[whatever module you want]
             
-            ps.constant([(), 0, 0]) # Sets the streamer to a constant output of 0 if Output State fails
+            if reset_on_entry:
+                ps.reset() # resets the pulse streamer to 0V, otherwise final=OutputState(...) below leaves it off
 
             AOMsequence = ps.createSequence() # create the sequence class
-            patt_d_ch0 = [] # creates an empty sequence
             time_steps = np.linspace(t_i, t_f, num_points-1) # creates a list of desired times
 
-            for i in range(num_points-1): #builds the pulse sequence based on numbe○r of desired data-points at each delay time, start time (t_i) and end time (t_f)
-                
-                patt_d_ch0.append((time_steps[i],1)) # streams (on) for desired time/data-point
-                patt_d_ch0.append((40e3,0)) # pause (off) for 25 milli-seconds
+            # builds the pulse sequence based on number of desired data-points at each delay time, start time (t_i) and end time (t_f)
+            # on for each desired time/data-point, then a 40us pause (off)
+            patt_d_ch0 = list(_aomPattern(t_i, t_f, num_points-1, 40_000))
+            time_steps_s = time_steps*1e-9
             
             AOMsequence.setDigital([0,1], patt_d_ch0) # loads pulse sequence on desired digital channel
 
-            '''Use ps.reset() in case the pulse streamer doesnt turn off, then click 'run' again in the gui'''
-
             signal = StreamingList()
             time_sweeps = StreamingList()
+            average = StreamingList()
+            payload = {'params': {'start': t_i, 'stop': t_f, 'num_points': num_points, 'iterations': iterations},
+                       **_AOM_PLOT,
+                       'datasets': {'signal' : time_sweeps, 'average': average}}
 
             with TreelessNIDAQ() as NIDAQ:
 
-                for i in range(iterations):
-
-                    sig_counts = np.empty(num_points-1)
-                    sig_counts[:] = np.nan
-                    time_sweeps.append(time_steps*1e-9)
-                    time_sweeps.append(sig_counts)
-
-                    NIDAQ.start_read_tasks_swabTimed(num_points)
-                    ps.stream(AOMsequence, n_runs = 2, final = OutputState([],0,0))
-                    counts, flags = NIDAQ.read_samples(num_points)
-
-                    for j in range(len(time_steps)):
-                        
-                        time_sweeps[-1][j] = counts[j]
-                        time_sweeps.updated_item(-1)
-                        #print(time_sweeps)
-                        test_data.push({'params': {'start': t_i, 'stop': t_f, 'num_points': num_points, 'iterations': iterations},
-                                    'title': 'Counts vs. Laser Exposure Time (ns)',
-                                    'xlabel': 'Pulse Duration (ns)',
-                                    'ylabel': 'Counts',
-                                    'datasets': {'signal' : time_sweeps}
-                    
-                    })
+                # every iteration in one stream: iterations*(num_points-1) clock edges back to back, plus
+                # one more run for the closing edge, so the sequence is only uploaded once
+                num_samples = iterations*(num_points-1) + 1
+                NIDAQ.start_read_tasks_swabTimed(num_samples)
+                ps.stream(AOMsequence, n_runs = iterations+1, final = OutputState([],0,0))
+                counts, flags = NIDAQ.read_samples(num_samples, timeout=(iterations+1)*AOMsequence.getDuration()/1e9 + 1) # all runs, plus 1s of overhead
+
+                # same layout as one iteration at a time: the time axis then that iteration's counts, for every iteration
+                # the counts are row views into one (iterations, num_points-1) block and share one time axis array
+                sweep_counts = counts.reshape(iterations, num_points-1).astype(float)
+                for iter_counts in sweep_counts:
+                    time_sweeps.append(time_steps_s)
+                    time_sweeps.append(iter_counts)
+                average.append(np.stack([time_steps_s, sweep_counts.mean(axis=0)])) # average over iterations in one reduction
+
+                test_data.push(payload)
         #plt.plot(time_steps, counts)
         #plt.show()
+
+
+class AOMStream(AOMPulse):
+    """AOM pulse train without counting, e.g. for looking at the AOM on a scope (formerly TaskVTime.py)."""
+
+    def AOM_pulse(self, dataset: str, t_i: float, t_f: float, num_points: int, iterations: int, reset_on_entry: bool = False):
+
+        """Args:
+            dataset: unused, nothing is counted (kept so the call matches AOMPulse.AOM_pulse)
+            t_i (float): start time (ns)
+            t_f (float): stop time (ns)
+            num_points (int): number of points between start-stop (inclusive)
+            iterations: number of times to repeat the experiment
+            reset_on_entry: reset the pulse streamer before streaming, e.g. if it didn't turn off after the last run
+        """
+        ps = PulseStreamer("169.254.8.2") # control the pulse streamer by using ps.[whatever module you want]
+
+        if reset_on_entry:
+            ps.reset() # resets the pulse streamer to 0V
+        
+        AOMsequence = ps.createSequence() # create the sequence class
+        # on for each desired time/data-point, then a 1 second pause (off)
+        patt_d_ch0 = list(_aomPattern(t_i, t_f, num_points, 1_000_000_000))
+        
+        _logger.debug('AOM pattern size=%d head=%r', len(patt_d_ch0), patt_d_ch0[:4]) # only formatted if debug logging is on
+        
+        AOMsequence.setDigital(0, patt_d_ch0) # loads pulse sequence on desired digital channel
+
+        ps.stream(AOMsequence, n_runs = iterations, final = OutputState([],0,0))
+
                     
 if __name__ == '__main__':
     exp = AOMPulse()
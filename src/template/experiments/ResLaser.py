@@ -4,16 +4,10 @@ import time
 import logging
 from pathlib import Path
 
-import numpy as np
-from nspyre import DataSource
-from nspyre import experiment_widget_process_queue
-from nspyre import StreamingList
 from nspyre import nspyre_init_logger
 
-import pulsestreamer # you can download the packages using pip, see swabian 8/2 documentation
-from pulsestreamer import *
-
-from template.drivers.insmgr import MyInstrumentManager
+# the method body doesn't talk to any instruments yet, so the heavy imports (numpy, pulsestreamer's grpc chain,
+# the instrument manager) are deferred into ResonantV1_Laser, uncomment them there along with the code that needs them
 #from template.drivers.nspyre_drivers.newfocus.tlb6725 import TLB6725 as NF
 
 _HERE = Path(__file__).parent
@@ -65,6 +59,12 @@ class ResonantV1Laser:
         # connect to the data server and create a data set, or connect to an
         # existing one with the same name if it was created earlier.
 
+        #import numpy as np
+        #from nspyre import DataSource, StreamingList, experiment_widget_process_queue
+        #import pulsestreamer # you can download the packages using pip, see swabian 8/2 documentation
+        #from pulsestreamer import *
+        #from template.drivers.insmgr import MyInstrumentManager
+
         #with MyInstrumentManager() as mgr, DataSource(dataset) as test_data:
             
            # swab_driver = mgr.swabian # acsess modules in 'SwabianPS82.py' by using swab_driver.[whatever module want]
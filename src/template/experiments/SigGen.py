@@ -25,6 +25,22 @@ _logger = logging.getLogger(__name__)
 class FrequencyGen:
     """Spin measurement experiments."""
 
+    _sg = None # AgilentE8257D shared by every Frequency_Gen call, so the VISA session is only opened once
+
+    @classmethod
+    def _get_sg(cls):
+        if cls._sg is None:
+            cls._sg = AGD()
+            _logger.info('Connected to %s', cls._sg.idn())
+        return cls._sg
+
+    @classmethod
+    def close(cls):
+        """Close the shared signal generator session."""
+        if cls._sg is not None:
+            cls._sg.close()
+            cls._sg = None
+
     def __init__(self, queue_to_exp=None, queue_from_exp=None):
         """
         Args:
@@ -58,18 +74,10 @@ class FrequencyGen:
     def Frequency_Gen(self, RFAmp: float, RFfrequency: float):
         
         """Write code in here for diagnostics"""
-        SG = AGD.SG_Connect()
-        AGD.idn(AGD)
-
-        AGD.set_rf_frequency(AGD, RFfrequency*1e9)
-        AGD.get_rf_frequency(AGD)
-
-        AGD.set_rf_amplitude(AGD, RFAmp)
-        AGD.get_rf_amplitude(AGD)
-
-        AGD.get_rf_toggle(AGD)
-        AGD.set_rf_toggle(AGD, 'OFF')
-        AGD.get_rf_toggle(AGD)
+        sg = self._get_sg()
+        # one compound SCPI message (and *OPC? to sync) instead of a round-trip per setting
+        sg.program(RFfrequency*1e9, RFAmp, on=False)
+        _logger.debug('RF frequency [GHz]: %s, RF amplitude [dBm]: %s, RF output: OFF', RFfrequency, RFAmp)
         
         """Args:
             dataset: name of the dataset to push data to
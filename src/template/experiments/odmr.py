@@ -4,6 +4,7 @@ This is example script demonstrates most of the basic functionality of nspyre.
 import time
 import logging
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from nspyre import DataSource
@@ -20,9 +21,38 @@ from template.drivers.insmgr import MyInstrumentManager
 _HERE = Path(__file__).parent
 _logger = logging.getLogger(__name__)
 
+_EDGE_NS = 100       # length of the clock and trigger pulses
+
+_ODMR_PLOT = {
+    'title': 'Optically Detected Magnetic Resonance',
+    'xlabel': 'Frequency (GHz)',
+    'ylabel': 'Count Rate (counts/s)',
+}
+_PUSH_EVERY_S = 0.25 # minimum time between pushes to the data server, the last iteration is always pushed
+
+def _odmr_sweep_patterns(num_points: int, dwell_ns: int, clk_chan: int, rf_gate_chan: int, sg_trig_chan: int):
+    """Returns {chan: [(duration, level), ...]} for one pass of a list-mode ODMR sweep
+    on the given swabian channels (see the SpinMeasurements channel settings).
+    Every frequency gets a dwell_ns signal window (RF on) then a dwell_ns background window (RF off),
+    each opened by a rising edge on the DAQ clock, with one more edge closing the last window.
+    The signal generator is triggered at the start of each background window so it has the whole
+    window to settle on the next frequency.
+    """
+    closing = [(_EDGE_NS, 1), (_EDGE_NS, 0)]
+    return {
+        clk_chan: [(_EDGE_NS, 1), (dwell_ns - _EDGE_NS, 0)]*(2*num_points) + closing,
+        rf_gate_chan: [(dwell_ns, 1), (dwell_ns, 0)]*num_points + [(2*_EDGE_NS, 0)],
+        sg_trig_chan: [(dwell_ns, 0), (_EDGE_NS, 1), (dwell_ns - _EDGE_NS, 0)]*num_points + [(2*_EDGE_NS, 0)],
+    }
+
 class SpinMeasurements:
     """Spin measurement experiments."""
 
+    # swabian digital channels for the ODMR sweep, override on the class or an instance to match the wiring
+    CLK_CHAN = 0        # DAQ sample clock (PFI2)
+    RF_GATE_CHAN = 1    # signal generator rear panel PULSE IN, high = RF on
+    SG_TRIG_CHAN = 2    # signal generator rear panel TRIG IN, steps to the next frequency in the list
+
     def __init__(self, queue_to_exp=None, queue_from_exp=None):
         """
         Args:
@@ -60,7 +90,7 @@ class SpinMeasurements:
         power: float,
         num_points: int,
         iterations: int,
-        period: int
+        period: float
     ):
         """Run a fake ODMR (optically detected magnetic resonance)
         PL (photoluminescence) sweep over a set of microwave frequencies.
@@ -71,93 +101,124 @@ class SpinMeasurements:
             stop_freq (float): stop frequency
             num_points (int): number of points between start-stop (inclusive)
             iterations: number of times to repeat the experiment
+            period (float): collection time (s) of each signal and each background window,
+                so one sweep takes about 2*num_points*period
+        The swabian drives the DAQ clock on CLK_CHAN, gates the RF through the signal generator's
+        PULSE IN on RF_GATE_CHAN and steps its frequency list through TRIG IN on SG_TRIG_CHAN.
         """
         # connect to the instrument server
         # connect to the data server and create a data set, or connect to an
         # existing one with the same name if it was created earlier.
 
-        SG = AGD.SG_Connect()
-        AGD.idn(AGD)
-
-        with MyInstrumentManager() as mgr, DataSource(dataset) as odmr_data:
+        # the signal generator is closed on exit, after the teardown below has switched its RF off
+        with MyInstrumentManager() as mgr, DataSource(dataset) as odmr_data, DAQ() as daq, AGD() as sg:
+            sg.idn()
             
             odmr_driver = mgr.odmr_driver
             ps = PS.PulseStreamer("169.254.8.2")
-            clk_sequence = ps.createSequence()
-            patt_d_ch0 = [(100, 1), (100, 0)]
-
-            # set the signal generator amplitude for the scan (dBm).
-
-            AGD.set_rf_amplitude(AGD, power)
 
             # frequencies that will be swept over in the ODMR measurement
 
             frequencies = np.linspace(start_freq, stop_freq, num_points)
 
+            # set the signal generator amplitude for the scan (dBm), and hand it the whole frequency list
+            # it steps to the next frequency on each trigger from the swabian, and the RF is gated by the swabian
+            # (RF on for the signal window, off for the background window), so the sweep never waits on a VISA write
+
+            sg.set_rf_amplitude(power)
+            sg.load_freq_list(frequencies)
+            sg.configure_list_sweep()
+            sg.set_pulse_gate(True)
+            sg.set_rf_toggle('ON') # the only RF output write of the scan, the swabian gates it from here on
+
+            # one sequence plays the whole sweep, with a DAQ clock edge opening every signal/background window
+            # period (s) is the collection time of each window
+
+            dwell_ns = int(round(period*1e9))
+            if dwell_ns <= _EDGE_NS:
+                raise ValueError(f'ODMR collection time {period}s must be longer than the {_EDGE_NS}ns clock pulse')
+            odmr_sequence = ps.createSequence()
+            for chan, chan_pattern in _odmr_sweep_patterns(num_points, dwell_ns, self.CLK_CHAN, self.RF_GATE_CHAN, self.SG_TRIG_CHAN).items():
+                odmr_sequence.setDigital(chan, chan_pattern)
+            num_samples = 2*num_points + 1 # 2 windows per point, plus the edge that closes the last one
+
+            # upload the sequence once, each iteration then replays it with a software start
+            ps.setTrigger(start=PS.TriggerStart.SOFTWARE, rerun=PS.TriggerRearm.AUTO)
+            ps.stream(odmr_sequence, n_runs=1, final=PS.OutputState([], 0, 0))
+
             # for storing the experiment data
-            # list of numpy arrays of shape (2, num_points)
+            # list of numpy arrays of shape (num_points,), the frequency axis is only pushed once as
+            # freqs_ghz and process_ODMR_data pairs it back up with the counts for plotting
 
             signal_sweeps = StreamingList()
             background_sweeps = StreamingList()
-
-            for i in range(iterations):
-
-                # photon counts corresponding to each frequency
-                # initialize to NaN
-
-                sig_counts = np.empty(num_points)
-                sig_counts[:] = np.nan
-                signal_sweeps.append(np.stack([frequencies/1e9, sig_counts]))
-                bg_counts = np.empty(num_points)
-                bg_counts[:] = np.nan
-                background_sweeps.append(np.stack([frequencies/1e9, bg_counts]))
-
-                # sweep counts vs. frequency.
-
-                for f, freq in enumerate(frequencies):
-
-                    # access the signal generator driver on the instrument server and set its frequency.
-                    
-                    AGD.set_rf_frequency(AGD, freq)
-                    AGD.set_rf_toggle(AGD, 'ON')
-                    
-                    # read the number of photon counts received by the photon counter.
-                    
-                    '''Add DAQ counts, not odmr_driver.counts(0.005)'''
-                    clk_sequence.setDigital(0, patt_d_ch0)
-                    ps.stream(clk_sequence, PS.PulseStreamer.REPEAT_INFINITELY)
-
-                    print(signal_sweeps[-1][1])
-                    print(DAQ.read_ctrs_ext_clk(DAQ, period, 2)[0])
-                    signal_sweeps[-1][1][f] = DAQ.read_ctrs_ext_clk(DAQ, period, 5)[0][0]
-                    
-                    # notify the streaminglist that this entry has updated so it will be pushed to the data server
-                    
-                    signal_sweeps.updated_item(-1)
-
-                    # set the signal generator off for a background noise signal
-                    
-                    AGD.set_rf_toggle(AGD, 'OFF')
-                    '''Add DAQ counts, not odmr_driver.counts(0.005)'''
-                    background_sweeps[-1][1][f] = DAQ.read_ctrs_ext_clk(DAQ, period, 2)
-                    background_sweeps.updated_item(-1)
-
-                    
-                    # save the current data to the data server.
-                    odmr_data.push({'params': {'start': start_freq, 'stop': stop_freq, 'power': power, 'num_points': num_points, 'iterations': iterations},
-                                    'title': 'Optically Detected Magnetic Resonance',
-                                    'xlabel': 'Frequency (GHz)',
-                                    'ylabel': 'Counts',
-                                    'datasets': {'signal' : signal_sweeps,
-                                                'background': background_sweeps}
-                    })
-
-                    AGD.get_rf_toggle(AGD)
-
-                    if experiment_widget_process_queue(self.queue_to_exp) == 'stop':
+            # every sweep's counts are a row view into one block per series, allocated up front
+            sig_all = np.full((iterations, num_points), np.nan)
+            bg_all = np.full_like(sig_all, np.nan)
+            freqs_ghz = (frequencies/1e9).astype(np.float64)
+            payload = {'params': {'start': start_freq, 'stop': stop_freq, 'power': power, 'num_points': num_points, 'iterations': iterations},
+                       **_ODMR_PLOT,
+                       'datasets': {'freqs_ghz': freqs_ghz,
+                                   'signal' : signal_sweeps,
+                                   'background': background_sweeps}}
+            last_push = -np.inf
+
+            # pushes run on a worker thread while the next sweep is acquired, the StreamingLists are only
+            # touched again once the previous push has finished
+            pusher = ThreadPoolExecutor(max_workers=1)
+            pending_push = None
+
+            try:
+                # the counter runs for the whole scan and hands back one sweep (num_samples edges) at a time,
+                # it is started before the first sweep so it sees the first clock edge
+                daq.start_ctrs_continuous(1/period, num_samples)
+                for i in range(iterations):
+
+                    # play the sweep once
+                    ps.startNow()
+                    raw = daq.next_ctrs_chunk(timeout=num_samples*period + 1)[0]
+                    if pending_push is not None:
+                        pending_push.result() # also raises here if the push failed
+
+                    # windows alternate signal, background for every frequency
+                    # converted to count rates straight into this sweep's rows
+                    sig_counts, bg_counts = sig_all[i], bg_all[i]
+                    np.divide(raw[0::2], period, out=sig_counts)
+                    np.divide(raw[1::2], period, out=bg_counts)
+                    signal_sweeps.append(sig_counts)
+                    background_sweeps.append(bg_counts)
+                    if _logger.isEnabledFor(logging.DEBUG):
+                        # totals and the first few points, formatting whole long sweeps would be O(num_points) per log line
+                        _logger.debug('ODMR iteration %d signal total=%g head=%s background total=%g head=%s',
+                                      i, sig_counts.sum(), sig_counts[:4], bg_counts.sum(), bg_counts[:4])
+
+                    stop = experiment_widget_process_queue(self.queue_to_exp) == 'stop'
+
+                    # save the current data to the data server, at most every _PUSH_EVERY_S
+                    # but always for the last sweep so nothing is left unsent
+                    # rows are only ever appended (never edited after), and StreamingList tracks appends itself,
+                    # so no updated_item notifications are needed before the push
+                    if stop or i == iterations-1 or time.monotonic() - last_push > _PUSH_EVERY_S:
+                        pending_push = pusher.submit(odmr_data.push, payload)
+                        last_push = time.monotonic()
+                    else:
+                        pending_push = None
+
+                    if stop:
                         # the GUI has asked us nicely to exit
+                        pending_push.result()
                         return
 
+                if pending_push is not None:
+                    pending_push.result()
+            finally:
+                pusher.shutdown(wait=True)
+                daq.stop_ctrs_continuous()
+                ps.setTrigger(start=PS.TriggerStart.IMMEDIATE, rerun=PS.TriggerRearm.MANUAL) # back to the default for other experiments
+                sg.set_rf_toggle('OFF')
+                sg.set_pulse_gate(False)
+                sg.stop_rf_frequency_sweep()
+
 if __name__ == '__main__':
     exp = SpinMeasurements()
     exp.odmr_sweep('odmr', 3e9, 4e9, 101, 50)
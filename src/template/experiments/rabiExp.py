@@ -7,12 +7,14 @@ All rights reserved.
 This work is licensed under the terms of the 3-Clause BSD license.
 For a copy, see <https://opensource.org/licenses/BSD-3-Clause>.
 """
+from itertools import chain
+
 import numpy as np
 from nspyre import StreamingList
 
 from experiments.General.generalExperiments import CountsVsDV_Experiment
 from experiments.customUtils import setupIters, setupAPD, setupSigGen
-from experiments.PulsePatterns import Pulses, convertSecKwargsToNanosec, convertSecArgsToNanosec, convertRLEtoSeq #, convertDigRLEtoSeq #DEBUG
+from experiments.PulsePatterns import Pulses, SeqArr, convertSecKwargsToNanosec, convertSecArgsToNanosec #, convertRLEtoSeq, convertDigRLEtoSeq #DEBUG
 
 from drivers.ni.nidaqTimingFromSwab import TreelessNIDAQ
 
@@ -37,41 +39,76 @@ class RabiMeasurement(CountsVsDV_Experiment):
         #setup data storage structures
         Xs = np.linspace(*convertSecArgsToNanosec(minMwTime, maxMwTime), numMWtimes, dtype=int).tolist() #make these into int's of ns's here for convenience
         Ys = [[StreamingList() for X in Xs] for yNickname in self.yNicknames]
+        self._rabiResults = {} #tau -> results of the sweep being collected that haven't been returned yet (see expLoopMethod)
         return(Xs, Ys, iters)
 
 
     def expLoopMethod(self, gw, X, samplingFreq,
                       aomRiseLag: float, readoutTime:float, initTime:float, 
                       aomFallLagAndISC:float, bufferTime:float, aomV:float, **kwargs):
+        #every tau of a sweep is measured at once when the sweep starts (see _measureAllTaus), so each point just collects its result
+        #rounding to int ns can repeat a tau in Xs, so every tau keeps a list with one result per occurrence,
+        #and a new sweep is only measured once every result of the last one has been returned
+        if not self._rabiResults:
+            for tau, counts in self._measureAllTaus(gw, samplingFreq, aomRiseLag, readoutTime, initTime, aomFallLagAndISC, bufferTime, aomV):
+                self._rabiResults.setdefault(tau, []).append(counts)
+        tauResults = self._rabiResults.get(X)
+        if not tauResults:
+            raise(ValueError(f'No Rabi result left for tau={X}ns in this sweep, every point should be one of Xs'))
+        counts = tauResults.pop(0)
+        if not tauResults:
+            del self._rabiResults[X]
+        return(counts)
+
+
+    def _measureAllTaus(self, gw, samplingFreq, aomRiseLag, readoutTime, initTime, aomFallLagAndISC, bufferTime, aomV):
+        '''Streams one duty cycle of every tau back to back, over and over, and reads it all out in one DAQ acquisition
+        (instead of a Swabian upload and a new DAQ task for every tau). Returns [(tau, (mwCounts, noMwCounts)), ...] in Xs order'''
         #Start streaming the sequence that every datapoint will use
 
         gw.swabian.ps.constant( [(), 0,0]) #turn the Swab off before starting tasks so they're synced properly
 
-        swabRLE = Pulses().rabiWithBackground(tauTime = X, maxTauTime=self.Xs[-1], 
+        #only tauTime changes between points, so build the rest of the sequence once and just patch tau in
+        #the whole sweep's RLE is then the same sweep after sweep, so it's cached along with the template
+        Xs = self.Xs
+        templateArgs = (tuple(Xs), aomRiseLag, readoutTime, initTime, aomFallLagAndISC, bufferTime, aomV)
+        if getattr(self, '_rabiTemplateArgs', None) != templateArgs:
+            self._rabiTemplate = Pulses().buildRabiTemplate(maxTauTime=self.Xs[-1], 
                         **convertSecKwargsToNanosec(aomRiseLagTime=aomRiseLag, 
                             readOutTime=readoutTime, extraInitLaserTime=initTime,
                             aomFallLagAndISC=aomFallLagAndISC,  bufferTime=bufferTime), aomV=aomV)
+            self._rabiTemplateArgs = templateArgs
+            #the no-MW half and the maxTau-tau wait balance every tau to the same length, so the duration only changes with the template
+            self._rabiSeqDuration = SeqArr.fromRLE(Pulses().rabiFromTemplate(self._rabiTemplate, self.Xs[-1])).getDuration()
+            pulses = Pulses()
+            self._rabiSweepRLE = list(chain.from_iterable(pulses.rabiFromTemplate(self._rabiTemplate, X) for X in Xs)) #one duty cycle per tau
+        swabRLE = self._rabiSweepRLE
         numSamplesPerDC = 4 #both read windows and deadtimes
         
         #for a given sampling freq, you need to take numSamplesPerDutyCycle*SamplingTime/DutyCycle
-        #here we round that fraction up (floor div+1) and use 1/sampleFreq as SamplingTime
+        #here we round that fraction up (floor div+1) and use 1/sampleFreq as SamplingTime, for every tau
         #and plus 2 because of start/end buffers?!? Not entirely sure if necessary but should have minimum timing overhead
-        num_samples = 2+numSamplesPerDC*int(1+1e9//(convertRLEtoSeq(swabRLE).getDuration()*samplingFreq))
-        #print(type(num_samples)) #DEBUG
+        seqDuration = self._rabiSeqDuration
+        numSweeps = 1+int(1e9//(seqDuration*samplingFreq)) #same number of duty cycles per tau as measuring one tau at a time
+        numDCs = numSweeps*len(Xs)
+        num_samples = 2+numSamplesPerDC*numDCs
 
         with TreelessNIDAQ() as NIDAQ:
             NIDAQ.start_read_tasks_swabTimed(num_samples)
             gw.swabian.runSequenceInfinitely(swabRLE)
-            counts, flags = NIDAQ.read_samples(num_samples)
+            #wait for every duty cycle to be read, plus 1s of overhead
+            counts, flags = NIDAQ.read_samples(num_samples, timeout=(numDCs+1)*seqDuration/1e9 + 1)
         
-        #print(counts, flags) #DEBUG
-        #for flag in flags: #DEBUG
-        #    print(flag) #DEBUG
-        for i,flag in enumerate(flags[numSamplesPerDC-1::numSamplesPerDC]):
-            if flag != 1: #TODO: Make this more robust in a TTL Flag is lost/missed
-                raise(ValueError(f'WARNING! Flag was not detected at {i*(numSamplesPerDC+1)}, instead {flag}'))
-        noMWcounts, mwCounts = counts[0:numSamplesPerDC-1+i*numSamplesPerDC:numSamplesPerDC], counts[2:numSamplesPerDC-1+i*numSamplesPerDC:numSamplesPerDC] #go until last Flag signal
-        return(int(np.sum(mwCounts)), int(np.sum(noMWcounts)))
+        flagSlice = np.asarray(flags[numSamplesPerDC-1::numSamplesPerDC])
+        missed = np.flatnonzero(flagSlice != 1) #check every duty cycle's flag in one pass
+        if missed.size: #TODO: Make this more robust in a TTL Flag is lost/missed
+            i = int(missed[0])
+            raise(ValueError(f'WARNING! Flag was not detected at {i*(numSamplesPerDC+1)}, instead {flagSlice[i]}'))
+        #duty cycles go tau by tau, sweep after sweep, so sum each tau's noMW (1st) and MW (3rd) windows over the sweeps
+        dcCounts = counts[:numSamplesPerDC*numDCs].reshape(numSweeps, len(Xs), numSamplesPerDC)
+        #one int64 reduction over both windows, and one tolist() to turn every sum into a python int (instead of int() per value)
+        tauSums = dcCounts[:, :, [2, 0]].sum(axis=0, dtype=np.int64).tolist()
+        return( [(X, (mwSum, noMwSum)) for X, (mwSum, noMwSum) in zip(Xs, tauSums)] )
         
 
 
@@ -57,8 +57,14 @@ class ODMRWidget(ExperimentWidget):
                 'widget': SpinBox(value=50, int=True, bounds=(1, None), dec=True),
             },
             'period': {
-                'display_text': 'Collection Time',
-                'widget': SpinBox(value=0.1, int=False, bounds=(0.1, None), dec=True),
+                'display_text': 'Collection Time (per window)',
+                'widget': SpinBox(
+                    value=10e-3,
+                    suffix='s',
+                    siPrefix=True,
+                    bounds=(1e-6, None),
+                    dec=True,
+                ),
             },
             'dataset': {
                 'display_text': 'Data Set',
@@ -148,30 +154,38 @@ class SigGenWidget(ExperimentWidget):
 
 
 def process_ODMR_data(sink: DataSink):
-    """Subtract the signal from background trace and add it as a new 'diff' dataset."""
-    diff_sweeps = []
-    for s,_ in enumerate(sink.datasets['signal']):
-        freqs = sink.datasets['signal'][s][0]
-        sig = sink.datasets['signal'][s][1]
-        bg = sink.datasets['background'][s][1]
-        diff_sweeps.append(np.stack([freqs, sig - bg]))
-    sink.datasets['diff'] = diff_sweeps
+    """Pair the signal and background counts with the frequency axis (pushed once as 'freqs_ghz')
+    as the new 'signal_vs_freq' and 'background_vs_freq' datasets, then subtract the background from
+    the signal and add it as a new 'diff' dataset. The pushed datasets are left untouched, so calling
+    this again on the same sink (the plot does on every forced update) gives the same result."""
+    freqs = np.asarray(sink.datasets['freqs_ghz'])
+    sig = np.asarray(sink.datasets['signal'], dtype=float).reshape(-1, freqs.size)
+    bg = np.asarray(sink.datasets['background'], dtype=float).reshape(-1, freqs.size)
+    # one (series, sweep, freq/counts, point) block for all three derived series, so the frequency axis is broadcast once
+    # and each sweep handed to the plots is a (2, num_points) view into it
+    # it is rebuilt from the pushed datasets on every call and only ever stored under the derived keys
+    paired = np.empty((3, sig.shape[0], 2, freqs.size))
+    paired[:, :, 0] = freqs
+    paired[0, :, 1] = sig
+    paired[1, :, 1] = bg
+    np.subtract(sig, bg, out=paired[2, :, 1])
+    sink.datasets['signal_vs_freq'], sink.datasets['background_vs_freq'], sink.datasets['diff'] = (list(series) for series in paired)
 
 class FlexLinePlotWidgetWithODMRDefaults(FlexLinePlotWidget):
     """Add some default settings to the FlexSinkLinePlotWidget."""
     def __init__(self):
         super().__init__(data_processing_func=process_ODMR_data)
         # create some default signal plots
-        self.add_plot('sig_avg',        series='signal',   scan_i='',     scan_j='',  processing='Average')
-        self.add_plot('sig_latest',     series='signal',   scan_i='-1',   scan_j='',  processing='Average')
-        self.add_plot('sig_first',      series='signal',   scan_i='0',    scan_j='1', processing='Average')
-        self.add_plot('sig_latest_10',  series='signal',   scan_i='-10',  scan_j='',  processing='Average')
+        self.add_plot('sig_avg',        series='signal_vs_freq',   scan_i='',     scan_j='',  processing='Average')
+        self.add_plot('sig_latest',     series='signal_vs_freq',   scan_i='-1',   scan_j='',  processing='Average')
+        self.add_plot('sig_first',      series='signal_vs_freq',   scan_i='0',    scan_j='1', processing='Average')
+        self.add_plot('sig_latest_10',  series='signal_vs_freq',   scan_i='-10',  scan_j='',  processing='Average')
         self.hide_plot('sig_first')
         self.hide_plot('sig_latest_10')
 
         # create some default background plots
-        self.add_plot('bg_avg',         series='background',   scan_i='',     scan_j='',  processing='Average')
-        self.add_plot('bg_latest',      series='background',   scan_i='-1',   scan_j='',  processing='Average')
+        self.add_plot('bg_avg',         series='background_vs_freq',   scan_i='',     scan_j='',  processing='Average')
+        self.add_plot('bg_latest',      series='background_vs_freq',   scan_i='-1',   scan_j='',  processing='Average')
 
         # create some default diff plots
         self.add_plot('diff_avg',       series='diff',  scan_i='',      scan_j='',  processing='Average')